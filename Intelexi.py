@@ -1,91 +1,119 @@
+import time
+_script_started = time.perf_counter()
+
+import re
 import streamlit as st
-import pdfplumber
-from sentence_transformers import SentenceTransformer
-import wikipedia
-import numpy as np
-import io
-import tempfile
-import os
-from faster_whisper import WhisperModel
-from groq import Groq
+import uuid
+from utils import pdf_utils
+from utils.engine import Engine, MODEL_NAME
+from utils.llm_gateway import make_client
+from utils.whisper_utils import DEFAULT_PROFILE, PROFILES, format_timestamp
+from utils.tracing import METRICS
+from utils.chat_utils import PAGE_SIZE, ChatStore, bubble_html
+from utils.library_utils import OWNER, AccessDenied, UnknownCollection
+from utils.warmup import process_age
 
 # -------------------------------
-client = Groq(api_key=st.secrets.get("GROQ_API_KEY", ""))  # ⭐ keep but safe-get
-model_name = "llama-3.1-8b-instant"
-print("Loaded client successfully!")
+model_name = MODEL_NAME
 
 
 # -------------------------------
-def clean_text(text):
-    text = text.replace("\n", " ").replace("\t", " ")
-    return " ".join(text.split())
-
-def load_whisper_model():
-    # 🔥 CHANGED: use session_state to ensure single load and re-use
-    if "whisper_model" not in st.session_state:
-        st.session_state["whisper_model"] = WhisperModel( "tiny",              
-            device="cpu",          # no GPU needed
-            compute_type="int8",   # prevents meta-tensor error
-            cpu_threads=2,         # safe for cloud
-            download_root="models" # cached download
-        )
-
-    return st.session_state["whisper_model"]
-
-def load_pdf_text(files):
-    full_text = ""
-    failed_files = []
+@st.cache_resource
+def get_engine():
+    # 🔥 CHANGED: one engine per process (models, caches, corpora), shared by all sessions
+    api_key = st.secrets.get("GROQ_API_KEY", "")  # ⭐ keep but safe-get
+    # 🔥 CHANGED: the Groq client (pooled, gateway retries) is built on first use or by the warm-up, not here
+    engine = Engine(lambda: make_client(api_key), model_name=model_name)
+    print("Loaded engine successfully!")
+    return engine
+
+@st.cache_resource
+def load_chat_store():
+    return ChatStore()
+
+def session_id():
+    # only in session state: the id opens this session's uploads, so it must not end up in a shareable URL
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    return st.session_state["session_id"]
+
+def signed_in_user():
+    # Streamlit's built-in login (st.login) is the only real identity here
+    login = getattr(st, "user", None)
+    if login is not None and login.get("is_logged_in"):
+        return login.get("email") or login.get("sub")
+    return None
+
+def chat_id():
+    # 🔥 CHANGED: the stored chat outlives the browser session. Signed-in users get theirs back
+    # on any reload or device; anyone else can reopen it with the chat code from the sidebar.
+    user = signed_in_user()
+    if user:
+        return f"user:{user}"
+    if "chat_id" not in st.session_state:
+        st.session_state["chat_id"] = uuid.uuid4().hex
+    return st.session_state["chat_id"]
+
+def save_turn(question, answer):
+    load_chat_store().append(chat_id(), ("user", question), ("assistant", answer))
+
+def render_bubbles(messages):
+    for role, message in messages:
+        st.markdown(bubble_html(role, message), unsafe_allow_html=True)
+
+def render_recent():
+    st.markdown("---")
+    st.markdown("### Recent conversation")
+    render_bubbles(load_chat_store().recent(chat_id()))
+    st.markdown("<div id='chat-end'></div>", unsafe_allow_html=True)
 
-    for f in files:
-        try:
-            with pdfplumber.open(f) as pdf:
-                file_text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        file_text += page_text + " "
-            if file_text.strip() == "":
-                failed_files.append(f.name)
-            else:
-                full_text += file_text
-
-        except Exception:
-            failed_files.append(getattr(f, "name", "unknown"))
-
-    if failed_files:
-        st.warning(f"⚠️ Could not extract text from: {', '.join(failed_files)}")
-
-    return clean_text(full_text)
-
-def split_text(text, chunk_size=200):
-    words = text.split()
-    return [" ".join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
-
-def embed_chunks(model, chunks):
-    emb = model.encode(chunks, convert_to_tensor=False)
-    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
-    return emb
-
-def get_top_k_chunks(query, model, chunks, chunk_embeddings, k=3):
-    query_emb = model.encode([query])[0]
-    query_emb = query_emb / np.linalg.norm(query_emb)
-    # protect shapes
-    if chunk_embeddings is None or len(chunk_embeddings) == 0:
-        return []
-    scores = np.dot(chunk_embeddings, query_emb)
-
-    boost = np.array([3 if "preamble" in c.lower() else 1 for c in chunks])
-    scores = scores * boost
-
-    top_idx = np.argsort(scores)[::-1][:k]
-    return [chunks[i] for i in top_idx]
-
-def ask_model(client, model_name, prompt):
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "user", "content": prompt}]
+def render_answer(question, mode):
+    """
+    Answer through the engine and render the winning answer token by
+    token; returns (answer, branch), or (None, None) if the LLM failed.
+    Pressing Stop reruns the script, which closes the stream; the partial
+    answer is kept in session_state and saved to the chat on the next run.
+    """
+    st.button("⏹ Stop answer", key="stop_stream")
+    placeholder = st.empty()
+
+    def on_token(text):
+        st.session_state["pending_answer"] = (question, text)
+        placeholder.markdown(bubble_html("assistant", text + "▌"), unsafe_allow_html=True)
+
+    try:
+        answer, branch = get_engine().ask_sync(session_id(), question, mode=mode, on_token=on_token)
+    except Exception as exc:
+        # e.g. a bad API key or the LLM still rate limited after retries
+        placeholder.empty()
+        st.session_state.pop("pending_answer", None)
+        st.error(f"⚠️ Could not get an answer: {type(exc).__name__}: {exc}")
+        return None, None
+    placeholder.empty()
+    st.session_state.pop("pending_answer", None)
+    return answer, branch
+
+def render_waterfall(trace):
+    """Sidebar bars: one row per span, offset and width relative to the whole request."""
+    total = max(trace["duration_ms"], 1e-6)
+    rows = []
+    for s in trace["spans"]:
+        left = 100 * s["offset_ms"] / total
+        width = max(100 * s["duration_ms"] / total, 0.5)
+        extra = ", ".join(f"{k}={v}" for k, v in s.items() if k not in ("name", "offset_ms", "duration_ms"))
+        rows.append(
+            f"<div style='font-size:12px;margin-top:4px'>{s['name']} · {s['duration_ms']:.0f} ms"
+            f"<span style='opacity:.6'> {extra}</span></div>"
+            f"<div style='background:rgba(255,255,255,.06);height:8px;border-radius:4px'>"
+            f"<div style='margin-left:{left:.1f}%;width:{width:.1f}%;height:8px;"
+            f"border-radius:4px;background:#0ea5a9'></div></div>"
+        )
+    st.markdown(
+        f"**{trace['trace']}** · {trace['duration_ms']:.0f} ms"
+        + (f" · {trace['branch']}" if trace.get("branch") else "")
+        + "".join(rows),
+        unsafe_allow_html=True,
     )
-    return response.choices[0].message.content
 
 
 st.set_page_config(page_title="Intelexi.ai", page_icon="🔍", layout="wide")
@@ -162,66 +190,108 @@ st.markdown("""
 st.markdown("#### 🤖 Hi Buddy! How can I assist you?")
 
 
-if "chat" not in st.session_state:
-    st.session_state["chat"] = []
 if "mode" not in st.session_state:
     st.session_state["mode"] = "home"  # home / voice / text
-if "uploaded_files" not in st.session_state:
-    st.session_state["uploaded_files"] = []
-if "chunks" not in st.session_state:
-    st.session_state["chunks"] = []
-if "chunk_embeddings" not in st.session_state:
-    st.session_state["chunk_embeddings"] = np.array([])
-if "embedder" not in st.session_state:
-    st.session_state["embedder"] = None
 if "last_transcription" not in st.session_state:
     st.session_state["last_transcription"] = ""
 if "last_query" not in st.session_state:
     st.session_state["last_query"] = ""
+if "pending_answer" in st.session_state:
+    # an answer was stopped mid-stream on the previous run: keep what arrived
+    stopped_question, partial = st.session_state.pop("pending_answer")
+    save_turn(stopped_question, partial + " …(stopped)")
 
 
 with st.sidebar:
     st.header("⚙️ Settings")
     st.text_input("🤖 Model Name (GROQ Models)", value=model_name, key="sidebar_modelname")
+    st.selectbox(
+        "🎙 Transcription profile", list(PROFILES),
+        index=list(PROFILES).index(DEFAULT_PROFILE), key="whisper_profile",
+        help="accurate = beam search of 5 (default), fast = greedy decoding: lowest latency, slightly less accurate",
+    )
     if st.button("🗑 Clear Chat & Reset"):
-        # 🔥 CHANGED: clear relevant keys but keep whisper model loaded
-        keep = {}
-        if "whisper_model" in st.session_state:
-            keep["whisper_model"] = st.session_state["whisper_model"]
+        # models live in the shared engine; only this session's documents and the stored chat go
+        get_engine().drop_session(session_id())
+        load_chat_store().clear(chat_id())
         st.session_state.clear()
-        st.session_state.update(keep)
         st.session_state["mode"] = "home"
         st.rerun()
+    if signed_in_user() is None:
+        st.caption(f"💬 Chat code: `{chat_id()}` — enter it below later to reopen this chat.")
+        resume = st.text_input("Resume a chat", key="resume_chat", placeholder="chat code").strip()
+        # only codes this app hands out: a typed "user:..." must not open a signed-in user's chat
+        if st.button("↩️ Resume chat") and re.fullmatch(r"[0-9a-f]{32}", resume):
+            st.session_state["chat_id"] = resume
+            st.session_state["chat_page"] = 0
+            st.rerun()
+    with st.expander("📚 Library"):
+        # 🔥 CHANGED: shared collections, stored once on the server for every session
+        engine = get_engine()
+        user = signed_in_user()
+        if user:
+            st.caption(f"👤 Signed in as {user}")
+        else:
+            user = st.text_input(
+                "👤 Library name (not a login)", value="local", key="library_user",
+                help="Anyone can type any name here, so collection sharing is not access control "
+                     "unless the app is set up with Streamlit login.",
+            )
+            st.caption("⚠️ Not authenticated: this name only separates collections, it does not protect them.")
+        readable = engine.library.collections(user)
+        attached = st.multiselect(
+            "Search these collections", [c["name"] for c in readable], key="attached_collections",
+            help="Searched together with the PDFs you upload in this session.",
+        )
+        try:
+            engine.attach(session_id(), user, attached)
+        except (AccessDenied, UnknownCollection) as exc:
+            # e.g. access revoked or the collection deleted since the list was drawn
+            st.error(f"⚠️ Could not search the selected collections: {type(exc).__name__}: {exc}")
+        publish_name = st.text_input("Save my uploads as collection", key="publish_name")
+        if st.button("📥 Save to library") and publish_name.strip():
+            try:
+                added = engine.publish(session_id(), user, publish_name.strip())
+                st.success(f"Added {added} document(s) to {publish_name.strip()}")
+            except (AccessDenied, ValueError) as exc:
+                st.error(f"⚠️ {exc}")
+        owned = [c["name"] for c in readable if c["role"] == OWNER]
+        if owned:
+            share = st.selectbox("Share collection", owned, key="share_collection")
+            share_with = st.text_input("with user (* = everyone)", key="share_with")
+            if st.button("🤝 Share") and share_with.strip():
+                engine.library.grant(share, user, share_with.strip())
+                st.success(f"{share_with.strip()} can now read {share}")
+    with st.expander("🧠 Loaded models"):
+        model_stats = get_engine().registry.stats()
+        if model_stats:
+            st.table(model_stats)
+        else:
+            st.caption("No models loaded yet.")
+        startup = get_engine().startup.snapshot()
+        if startup:
+            st.caption("🚀 Startup: " + ", ".join(f"{k} {v:.0f}" for k, v in startup.items()))
+        if get_engine().answers is not None:
+            cache_stats = get_engine().answers.stats()
+            st.caption(f"♻️ Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                       f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} stored")
 
 
-def process_uploaded_files(files, force_reprocess=False):
+def process_uploaded_files(files):
     """
-    Loads PDFs, splits, and embeds if needed.
-    Stores results in session_state to avoid double work.
+    Hands the uploader's files to the engine, which only reads and embeds
+    documents it has not seen in this session (a rerun is a cheap no-op).
     """
 
     if not files:
         return
-
-    # check if new files or force_reprocess
-    uploaded_names = [getattr(f, "name", None) for f in files]
-    prev_names = [getattr(f, "name", None) for f in st.session_state.get("uploaded_files", [])]
-
-    if force_reprocess or uploaded_names != prev_names or st.session_state["embedder"] is None:
-        st.session_state["uploaded_files"] = files
-        with st.spinner("📄 Reading documents..."):
-            full_text = load_pdf_text(files)
-        if full_text.strip() == "":
-            st.error("⚠️ Could not read any text from the PDF.")
-            st.session_state["chunks"] = []
-            st.session_state["chunk_embeddings"] = np.array([])
-            return
-        chunks = split_text(full_text)
-        st.session_state["chunks"] = chunks
-        if st.session_state["embedder"] is None:
-            st.session_state["embedder"] = SentenceTransformer("all-MiniLM-L6-v2")
-        with st.spinner("🧠 Processing document..."):
-            st.session_state["chunk_embeddings"] = embed_chunks(st.session_state["embedder"], chunks)
+    with st.spinner("📄 Reading documents..."):
+        result = get_engine().ingest(session_id(), files)
+    if result["skipped"]:
+        return
+    pdf_utils.warn_failed(result["failed"])
+    if result["chunks"] == 0:
+        st.error("⚠️ Could not read any text from the PDF.")
 
 
 if st.session_state["mode"] == "home":
@@ -259,11 +329,12 @@ if st.session_state["mode"] == "home":
 
         if st.button("💬 View Chat"):
             st.session_state["mode"] = "chat"
+            st.session_state["chat_page"] = 0
             st.rerun()
         st.markdown(
             f"""
             <div class="card" aria-hidden="true">
-                <h2>📂 {len(st.session_state['chat'])//2} Conversations</h2>
+                <h2>📂 {load_chat_store().count(chat_id())//2} Conversations</h2>
                 <p>View the chat history or return here anytime.</p>
             </div>
             """,
@@ -279,11 +350,22 @@ elif st.session_state["mode"] == "chat":
         st.session_state["mode"] = "home"
         st.rerun()
     st.markdown("---")
-    for role, message in st.session_state["chat"]:
-        if role == "user":
-            st.markdown(f"<div class='user-bubble'><b>🧑 You:</b><br>{message}</div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='bot-bubble'><b>🤖 AI:</b><br>{message}</div>", unsafe_allow_html=True)
+    # 🔥 CHANGED: one page at a time, newest first; older pages load on demand
+    store = load_chat_store()
+    pages = store.pages(chat_id())
+    page = min(st.session_state.get("chat_page", 0), pages - 1)
+    col_older, col_info, col_newer = st.columns([1,2,1])
+    with col_older:
+        if st.button("⬅️ Older", disabled=page >= pages - 1):
+            st.session_state["chat_page"] = page + 1
+            st.rerun()
+    with col_info:
+        st.caption(f"Page {page + 1} of {pages} · {PAGE_SIZE} messages per page")
+    with col_newer:
+        if st.button("Newer ➡️", disabled=page == 0):
+            st.session_state["chat_page"] = page - 1
+            st.rerun()
+    render_bubbles(store.page(chat_id(), page))
     st.markdown("<div id='chat-end'></div>", unsafe_allow_html=True)
 
 # -------------------------------
@@ -303,33 +385,17 @@ elif st.session_state["mode"] == "voice":
     if uploaded_files_voice:
         process_uploaded_files(uploaded_files_voice)
 
-    whisper_model = load_whisper_model()
-
     audio_file = st.audio_input("Click to record your voice question")
 
     if audio_file is not None:
-        audio_bytes = audio_file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_audio_path = temp_audio.name
-
-        segments, info = whisper_model.transcribe(
-            temp_audio_path,
-            beam_size=5,  # allowed
-            temperature=0.0,  # allowed
-            initial_prompt=(
-                "Transcribe exactly as spoken. "
-                "The user will give programming commands such as: "
-                "'write a python code', 'generate java program', "
-                "'build algorithm', 'create a function'. "
-                "Do NOT convert words like 'write' to numbers like '5th'. "
-                "Do NOT auto-correct, guess, or interpret. "
-                "Strictly transcribe as text commands."
-            )
+        # 🔥 CHANGED: decode in memory (no temp .wav), VAD-trim silence, show segments as they finish
+        partial = st.empty()
+        transcribed_text = get_engine().transcribe(
+            session_id(), audio_file.getvalue(),
+            profile=st.session_state.get("whisper_profile"),
+            on_segment=lambda text: partial.info(f"🎙 {text} …"),
         )
-
-        texts = [seg.text if hasattr(seg, "text") else seg[2] for seg in segments]
-        transcribed_text = " ".join(texts).strip()
+        partial.empty()
 
         st.success(f"Transcribed: **{transcribed_text}**")
 
@@ -337,69 +403,29 @@ elif st.session_state["mode"] == "voice":
             st.session_state["last_transcription"] = transcribed_text
             question = transcribed_text
 
+            answer, _ = render_answer(question, "voice")
+
+            if answer is not None:
+                save_turn(question, answer)
+
+    # 🔥 CHANGED: long recordings (meetings, lectures) → timestamped transcript, pieces decoded in parallel
+    with st.expander("🎧 Transcribe a long recording"):
+        recording = st.file_uploader("Meeting or lecture audio", type=["wav", "mp3", "m4a", "ogg", "flac", "webm"],
+                                     key="long_recording")
+        if recording is not None:
+            progress = st.progress(0.0, text="Transcribing…")
+            segments = get_engine().transcribe_long(
+                session_id(), recording.getvalue(),
+                profile=st.session_state.get("whisper_profile"),
+                on_piece=lambda done, total: progress.progress(done / total, text=f"Transcribing… {done}/{total}"),
+            )
+            progress.empty()
+            transcript = "\n".join(f"[{format_timestamp(seg['start'])}] {seg['text']}" for seg in segments)
+            st.text_area("Transcript", transcript, height=300)
+            st.download_button("⬇ Download transcript", transcript, file_name=f"{recording.name}.txt")
 
-            if st.session_state.get("chunks") and len(st.session_state["chunks"]) > 0:
-                top_chunks = get_top_k_chunks(
-                    question,
-                    st.session_state["embedder"],
-                    st.session_state["chunks"],
-                    st.session_state["chunk_embeddings"],
-                    k=5
-                )
-                context = "\n\n".join(top_chunks)
-
-                prompt = f"""
-You are an AI assistant. Answer the question ONLY using the provided document context.
-Provide a detailed answer in 3–5 sentences by explaining each term clearly.
-If the answer is not found, respond: "Information not in document."
-
-CONTEXT:
-{context}
-
-QUESTION:
-{question}
-"""
-                answer = ask_model(client, model_name, prompt)
-
-                # If document does NOT contain the answer → fallback to Wikipedia or Model
-                if "Information not in document" in answer:
-                    try:
-                        wiki_summary = wikipedia.summary(question, sentences=4)
-                        answer = f"It’s not mentioned in the document, but here’s what I found:\n\n{wiki_summary}"
-                    except:
-                        # Wikipedia failed → model gives its own answer (fix for coding questions)
-                        answer = ask_model(client, model_name, question)
-
-
-            else:
-                try:
-                    wiki_summary = wikipedia.summary(question, sentences=4)
-                    prompt = f"""
-Use this Wikipedia information if helpful — otherwise provide the correct answer.
-
-{wiki_summary}
-
-Question: {question}
-"""
-                    answer = ask_model(client, model_name, prompt)
-
-                except:
-
-                    prompt = question
-                    answer = ask_model(client, model_name, prompt)
-
-            st.session_state["chat"].append(("user", question))
-            st.session_state["chat"].append(("assistant", answer))
-
-    # Show chat preview area
-    st.markdown("---")
-    st.markdown("### Recent conversation")
-    for role, message in st.session_state["chat"][-6:]:
-        if role == "user":
-            st.markdown(f"<div class='user-bubble'><b>🧑 You:</b><br>{message}</div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='bot-bubble'><b>🤖 AI:</b><br>{message}</div>", unsafe_allow_html=True)
-    st.markdown("<div id='chat-end'></div>", unsafe_allow_html=True)
+    # Show chat preview area (last few messages only)
+    render_recent()
 
 
 # -------------------------------
@@ -419,10 +445,6 @@ elif st.session_state["mode"] == "text":
     if uploaded_files_text:
         process_uploaded_files(uploaded_files_text)
 
-
-    if st.session_state.get("uploaded_files"):
-        process_uploaded_files(st.session_state["uploaded_files"])
-
     st.markdown("### 💬 Ask your question")
     query = st.text_input("Type your question here:", key="text_input_mode")
 
@@ -431,60 +453,11 @@ elif st.session_state["mode"] == "text":
         question = query.strip()
 
 
-        if st.session_state.get("chunks") and len(st.session_state["chunks"]) > 0:
-            top_chunks = get_top_k_chunks(
-                question,
-                st.session_state["embedder"],
-                st.session_state["chunks"],
-                st.session_state["chunk_embeddings"],
-                k=5
-            )
-            context = "\n\n".join(top_chunks)
-
-            prompt = f"""
-You are an AI assistant. Answer the question using ONLY the provided document context.
-Give a detailed explanation in 3–5 sentences.
-Expand the meaning of concepts from the document.
-If the answer is not found, respond with: "Information not in document."
-
-CONTEXT:
-{context}
-
-QUESTION:
-{question}
-"""
-            answer = ask_model(client, model_name, prompt)
-
-            # Document did NOT have answer → Wikipedia fallback
-            if "Information not in document" in answer:
-                try:
-                    wiki_summary = wikipedia.summary(question, sentences=4)
-                    answer = f"It’s not mentioned in the document, but here’s what Wikipedia says:\n\n{wiki_summary}"
-                except:
-                    # Wikipedia failed → general response
-                    answer = ask_model(client, model_name, question)
-
-
-        else:
-            try:
-                wiki_summary = wikipedia.summary(question, sentences=4)
-                prompt = f"""
-Use this Wikipedia information if helpful — otherwise provide the correct answer.
-
-{wiki_summary}
-
-Question: {question}
-"""
-                answer = ask_model(client, model_name, prompt)
-
-            except:
-
-                prompt = question
-                answer = ask_model(client, model_name, prompt)
+        answer, _ = render_answer(question, "text")
 
         # store in chat
-        st.session_state["chat"].append(("user", question))
-        st.session_state["chat"].append(("assistant", answer))
+        if answer is not None:
+            save_turn(question, answer)
 
         # scroll
         st.markdown("""<script>window.location.href = "#chat-end";</script>""", unsafe_allow_html=True)
@@ -499,16 +472,28 @@ Question: {question}
         """)
 
     # Show chat
-    st.markdown("---")
-    st.markdown("### Recent conversation")
-    for role, message in st.session_state["chat"][-6:]:
-        if role == "user":
-            st.markdown(f"<div class='user-bubble'><b>🧑 You:</b><br>{message}</div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='bot-bubble'><b>🤖 AI:</b><br>{message}</div>", unsafe_allow_html=True)
-    st.markdown("<div id='chat-end'></div>", unsafe_allow_html=True)
+    render_recent()
 
 
 else:
     st.session_state["mode"] = "home"
     st.rerun()
+
+
+# drawn last so it shows the request that just ran
+with st.sidebar:
+    with st.expander("⏱ Last request"):
+        last_trace = get_engine().session(session_id()).last_trace
+        if last_trace:
+            render_waterfall(last_trace)
+        else:
+            st.caption("Tracing is off or nothing has run yet.")
+        st.download_button(
+            "⬇️ Metrics (Prometheus)", METRICS.prometheus_text(),
+            file_name="intelexi_metrics.prom", mime="text/plain",
+        )
+
+# 🔥 CHANGED: the page is on screen; now load models in the background so the first question is fast
+get_engine().startup.mark("first_paint_ms", process_age() * 1000, once=True)
+get_engine().startup.mark("first_script_run_ms", (time.perf_counter() - _script_started) * 1000, once=True)
+get_engine().warm_up()
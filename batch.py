@@ -0,0 +1,113 @@
+"""
+Answer a file of questions against a folder of PDFs, without the UI.
+
+    python batch.py docs/ questions.jsonl --out answers.jsonl [--concurrency 8]
+
+questions.jsonl has one {"question": ..., "id": ...} per line ("id" is
+optional and defaults to the line number). Each answer is appended to
+--out as {"id", "question", "answer", "branch", "seconds"} as soon as it
+is ready, or {"id", "question", "error"} if it failed or a stage timed out
+(e.g. waiting on the rate limit). Re-running the same command skips the ids
+that already have an answer, so an interrupted run resumes where it stopped
+and failed or timed-out questions are retried.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from utils.engine import Engine
+
+SESSION_ID = "batch"
+
+
+def read_questions(path):
+    out = []
+    with open(path, encoding="utf-8") as fh:
+        for n, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            out.append((str(row.get("id", n)), row["question"]))
+    return out
+
+
+def answered_ids(path):
+    """Ids that already have an answer in `path`; a half-written last line (crash) is cut off."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        row = json.loads(line)
+        if "answer" in row:
+            done.add(str(row["id"]))
+    return done
+
+
+def pdfs_in(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(".pdf"))
+
+
+async def run(engine, questions, out_path, mode, concurrency):
+    started = time.perf_counter()
+    counts = {"answered": 0, "failed": 0}
+    with open(out_path, "a", encoding="utf-8") as out:
+        async for i, answer, branch, error in engine.ask_batch(
+            SESSION_ID, [q for _, q in questions], mode=mode, concurrency=concurrency,
+        ):
+            qid, question = questions[i]
+            if error is None:
+                row = {"id": qid, "question": question, "answer": answer, "branch": branch,
+                       "seconds": round(time.perf_counter() - started, 3)}
+                counts["answered"] += 1
+            else:
+                row = {"id": qid, "question": question, "error": error}
+                counts["failed"] += 1
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            done = counts["answered"] + counts["failed"]
+            if done % 50 == 0 or done == len(questions):
+                rate = done / max(time.perf_counter() - started, 1e-9)
+                print(f"{done}/{len(questions)} ({rate:.1f}/s)", file=sys.stderr)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="folder of PDFs to answer from")
+    parser.add_argument("questions", help="JSONL file of questions")
+    parser.add_argument("--out", default="answers.jsonl")
+    parser.add_argument("--mode", default="text", choices=["text", "voice"])
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="answers in flight (default: the LLM gateway's INTELEXI_LLM_MAX_IN_FLIGHT)")
+    parser.add_argument("--pdf-backend", default="pdfplumber", choices=["pdfplumber", "pypdf2"],
+                        help="pypdf2 needs PyPDF2 installed (not in requirements.txt)")
+    args = parser.parse_args()
+
+    done = answered_ids(args.out)
+    questions = [(qid, q) for qid, q in read_questions(args.questions) if qid not in done]
+    if done:
+        print(f"resuming: {len(done)} already answered, {len(questions)} to go", file=sys.stderr)
+    if not questions:
+        return
+
+    engine = Engine()
+    files = pdfs_in(args.corpus)
+    result = engine.ingest(SESSION_ID, files, backend=args.pdf_backend)
+    print(f"ingested {result['documents']} documents, {result['chunks']} chunks"
+          + (f"; could not read {', '.join(result['failed'])}" if result["failed"] else ""), file=sys.stderr)
+
+    counts = asyncio.run(run(engine, questions, args.out, args.mode, args.concurrency))
+    print(f"answered {counts['answered']}, failed {counts['failed']}", file=sys.stderr)
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Reproducible benchmarks for ingestion, retrieval, transcription and the
+end-to-end question path, all through the Engine the app and the service
+use (LLM gateway, answer cache, query batcher included). Everything runs
+locally: the corpus and audio are synthesised, and the Groq client and
+Wikipedia lookup are stubs with configurable latency. INTELEXI_* settings
+(chunker, PDF workers, ingest batch...) apply as in the app.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --out new.json --compare bench.json   # exit 1 on regression
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import wave
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils.answer_cache import AnswerCache
+from utils.embedding_cache import EmbeddingCache
+from utils.engine import Engine, default_registry
+from utils.library_utils import DocumentLibrary
+from utils.llm_gateway import LLMGateway
+from utils.transcript_cache import TranscriptCache
+
+WORDS = (
+    "policy employee leave salary clause section benefit travel expense approval manager "
+    "department contract period notice holiday insurance claim document report training "
+    "security access device network password incident review audit compliance budget"
+).split()
+
+
+# -------------------------------
+# synthetic inputs
+def make_pdf(pages):
+    """A minimal valid PDF with one Helvetica text line per row of each page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        words = text.split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        ops = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 750 Td {ops}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_corpus(files, pages, words_per_page, seed=0):
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for f in range(files):
+        texts = []
+        for p in range(pages):
+            body = " ".join(rng.choice(WORDS, words_per_page))
+            texts.append(f"Section {f}.{p} {body}. Code E-{1000 + f * pages + p}.")
+        data = io.BytesIO(make_pdf(texts))
+        data.name = f"synthetic_{f:03d}.pdf"
+        corpus.append(data)
+    return corpus
+
+
+def make_wav(seconds, speech_ratio=0.6, seed=0):
+    """16 kHz mono PCM: voiced bursts (harmonic tones) separated by silence."""
+    rng = np.random.default_rng(seed)
+    sr = 16000
+    audio = np.zeros(int(seconds * sr), dtype=np.float32)
+    t = 0
+    while t < len(audio):
+        burst = int(sr * rng.uniform(0.3, 0.8))
+        if rng.random() < speech_ratio:
+            x = np.arange(min(burst, len(audio) - t)) / sr
+            f0 = rng.uniform(100, 220)
+            audio[t:t + len(x)] = 0.2 * sum(np.sin(2 * np.pi * f0 * h * x) / h for h in (1, 2, 3))
+        t += burst
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((audio * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+# -------------------------------
+# stand-ins for network services and (optionally) the embedder
+class StubGroq:
+    """Mimics client.chat.completions.create (and .with_raw_response.create), streaming or not."""
+
+    def __init__(self, first_token_ms, tokens_per_s, answer_tokens=80):
+        self.first_token = first_token_ms / 1000
+        self.per_token = 1 / tokens_per_s
+        self.answer_tokens = answer_tokens
+        raw = SimpleNamespace(create=self.create_raw)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create, with_raw_response=raw))
+
+    def _text(self, messages):
+        prompt = messages[-1]["content"]
+        if "CONTEXT:" in prompt and "outside" in prompt.split("QUESTION:")[-1]:
+            return "Information not in document."
+        return " ".join(["answer"] * self.answer_tokens)
+
+    def create(self, model, messages, stream=False, **_):
+        text = self._text(messages)
+        if not stream:
+            time.sleep(self.first_token + self.per_token * len(text.split()))
+            msg = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+        def chunks():
+            time.sleep(self.first_token)
+            for word in text.split():
+                time.sleep(self.per_token)
+                delta = SimpleNamespace(content=word + " ")
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        return chunks()
+
+    def create_raw(self, **kwargs):
+        # what the LLM gateway calls to read rate-limit headers; the stub has no limits
+        response = self.create(**kwargs)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+def stub_wiki(latency_ms, hit_ratio=0.5):
+    def lookup(question):
+        time.sleep(latency_ms / 1000)
+        hit = zlib.crc32(question.encode()) % 100 < hit_ratio * 100
+        return "A short encyclopedia summary." if hit else None
+    return lookup
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words hashing embedder for machines without torch."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, batch_size=32, convert_to_tensor=False, **_):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for w in text.lower().split():
+                out[i, zlib.crc32(w.encode()) % self.dim] += 1.0
+        out[:, 0] += 1e-3
+        return out
+
+
+# -------------------------------
+def summarize(durations, items=1):
+    d = np.asarray(durations) * 1000
+    total = float(np.sum(d)) / 1000
+    return {
+        "runs": len(d),
+        "mean_ms": round(float(d.mean()), 3),
+        "p50_ms": round(float(np.percentile(d, 50)), 3),
+        "p95_ms": round(float(np.percentile(d, 95)), 3),
+        "p99_ms": round(float(np.percentile(d, 99)), 3),
+        "throughput_per_s": round(items * len(d) / total, 3) if total else None,
+    }
+
+
+def measure(fn, repeat, warmup=1, items=1):
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t)
+    return summarize(durations, items)
+
+
+def load_embedder(kind, threads=None):
+    if kind == "hash":
+        return HashEmbedder()
+    from utils.embedder_backends import load_embedder as load_backend
+    # "real" is the torch path, as before
+    return load_backend("all-MiniLM-L6-v2", "torch" if kind == "real" else kind, threads=threads)
+
+
+def make_engine(args, registry, client, namespace):
+    """An Engine like the app's, but on the stubs and with every store under --workdir."""
+    llm = LLMGateway(client, "stub", requests_per_minute=args.llm_rpm, tokens_per_minute=args.llm_tpm)
+    return Engine(
+        model_name="stub", registry=registry, llm=llm, wiki=stub_wiki(args.wiki_ms),
+        cache=EmbeddingCache(os.path.join(args.workdir, "embeddings"), namespace),
+        library=DocumentLibrary(os.path.join(args.workdir, "library")),
+        transcripts=TranscriptCache(os.path.join(args.workdir, "transcripts.sqlite")),
+        answers=AnswerCache(),
+    )
+
+
+def run(args):
+    results = {}
+    files = make_corpus(args.files, args.pages, args.words_per_page, args.seed)
+    pages = args.files * args.pages
+
+    registry = default_registry()
+    registry.register("embedder", lambda: load_embedder(args.embedder, args.embed_threads))
+    client = StubGroq(args.llm_first_token_ms, args.llm_tokens_per_s)
+    runs = iter(range(10**9))
+
+    # a fresh embedding cache each run: extraction, chunking and every chunk embedded
+    def ingest():
+        n = next(runs)
+        make_engine(args, registry, client, f"bench-{args.embedder}-{os.getpid()}-{n}").ingest(
+            "bench", files, backend=args.pdf_backend)
+    results["ingest"] = measure(ingest, max(1, args.repeat // 2), items=pages)
+
+    engine = make_engine(args, registry, client, f"bench-{args.embedder}")
+    engine.ingest("bench", files, backend=args.pdf_backend)
+    # a new session on the same files: the embeddings come from the cache
+    results["ingest_cached"] = measure(
+        lambda: engine.ingest(f"bench-{next(runs)}", files, backend=args.pdf_backend), args.repeat, items=pages)
+
+    rng = np.random.default_rng(args.seed)
+    questions = [f"what does section {rng.integers(args.files)}.{rng.integers(args.pages)} say about "
+                 f"{rng.choice(WORDS)}" for _ in range(args.queries)]
+    questions += [f"{q} outside" for q in questions[: args.queries // 4]]  # exercise the fallbacks
+    qi = iter(range(10**9))
+
+    def retrieve():
+        return engine.doc_prompt("bench", questions[next(qi) % len(questions)])
+    results["retrieve"] = measure(retrieve, args.queries)
+
+    # the same questions from many concurrent askers: one encode each vs the shared batcher
+    with ThreadPoolExecutor(args.askers) as pool:
+        for name, encode in (("query_encode_concurrent_unbatched", lambda q: engine.embedder().encode([q])),
+                             ("query_encode_concurrent", engine.query_batcher.encode)):
+            results[name] = measure(lambda: list(pool.map(encode, questions[:args.askers])),
+                                    args.repeat, items=args.askers)
+
+    # each question once (answer cache misses), then all of them again (hits)
+    for name in ("question_path", "question_path_cached"):
+        qi = iter(range(len(questions)))
+        results[name] = measure(lambda: engine.ask_sync("bench", questions[next(qi)]), len(questions), warmup=0)
+    results["llm_gateway"] = engine.llm.stats()
+
+    if args.whisper:
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            results["transcribe"] = {"skipped": "faster-whisper not installed"}
+        else:
+            # a different clip each run, so the transcript cache never answers
+            clips = iter([make_wav(args.audio_seconds, seed=args.seed + i) for i in range(args.repeat)])
+            results["transcribe"] = measure(
+                lambda: engine.transcribe("bench", next(clips), profile=args.whisper_profile),
+                max(1, args.repeat // 2))
+    return results
+
+
+def metadata(args):
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=False).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "git": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": vars(args),
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Print p50 deltas per stage; return the stages that got slower than `tolerance`."""
+    regressions = []
+    for stage, cur in current.items():
+        old = baseline.get(stage)
+        if not old or "p50_ms" not in cur or "p50_ms" not in old:
+            continue
+        change = (cur["p50_ms"] - old["p50_ms"]) / max(old["p50_ms"], 1e-9)
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{stage:22s} p50 {old['p50_ms']:10.3f} -> {cur['p50_ms']:10.3f} ms ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(stage)
+    return regressions
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--files", type=int, default=4)
+    p.add_argument("--pages", type=int, default=50)
+    p.add_argument("--words-per-page", type=int, default=300)
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--askers", type=int, default=50, help="concurrent askers for the query-encoding stages")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--pdf-backend", choices=["pdfplumber", "pypdf2"], default="pdfplumber",
+                   help="pypdf2 needs PyPDF2 installed (not in requirements.txt)")
+    p.add_argument("--embedder", choices=["real", "onnx", "onnx-int8", "hash"], default="real",
+                   help="'real' = torch; 'hash' is a torch-free stand-in (ingestion/retrieval plumbing only)")
+    p.add_argument("--embed-threads", type=int, default=None, help="intra-op threads for the embedder")
+    p.add_argument("--llm-first-token-ms", type=float, default=300)
+    p.add_argument("--llm-tokens-per-s", type=float, default=400)
+    p.add_argument("--llm-rpm", type=float, default=1e6, help="gateway request limit (the stub has none)")
+    p.add_argument("--llm-tpm", type=float, default=1e9, help="gateway token limit")
+    p.add_argument("--wiki-ms", type=float, default=250)
+    p.add_argument("--whisper", action="store_true", help="also benchmark transcription")
+    p.add_argument("--whisper-profile", default=None, help="default: INTELEXI_WHISPER_PROFILE (accurate)")
+    p.add_argument("--audio-seconds", type=float, default=5)
+    p.add_argument("--workdir", default=os.path.join("cache", "bench"))
+    p.add_argument("--out", help="write results JSON here")
+    p.add_argument("--compare", help="baseline results JSON to diff against")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    report = {"meta": metadata(args), "results": run(args)}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)["results"]
+        if compare(report["results"], baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Headless Intelexi: the same pipeline as the Streamlit app, over HTTP.
+
+    python service.py --port 8000
+
+    POST   /sessions/{id}/documents   multipart PDFs (?replace=1 drops the others)
+    POST   /sessions/{id}/ask         {"question": ..., "mode": "text", "stream": false}
+    POST   /sessions/{id}/transcribe  raw audio bytes (?profile=fast; ?long=1 for timestamped segments)
+    PUT    /sessions/{id}/collections {"collections": [...]} to search next to the uploads
+    DELETE /sessions/{id}
+    GET    /collections               the caller's readable library collections
+    POST   /collections/{name}/documents   multipart PDFs into a shared collection
+    POST   /collections/{name}/grants {"user": ..., "role": "read"}   (owner only)
+    DELETE /collections/{name}        (owner only)
+    GET    /health, /metrics          liveness + Prometheus text
+
+Library calls act as the user named in the X-Intelexi-User header; it is an
+identity, not a login, so put real authentication in front of the service.
+
+Each kind of work has its own concurrency limit and a bounded wait queue;
+when the queue is full the request gets 503 with Retry-After instead of
+piling up. With "stream": true, /ask answers in NDJSON: {"text": ...} lines
+as the answer grows, then {"answer": ..., "branch": ...}.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from aiohttp import web
+
+from utils.engine import MODES, Engine, Upload
+from utils.library_utils import READ, AccessDenied, InvalidRequest, UnknownCollection
+from utils.tracing import METRICS
+from utils.whisper_utils import PROFILES
+
+# simultaneous requests per kind of work, and how many may wait for a slot
+MAX_ASKS = int(os.getenv("INTELEXI_MAX_ASKS", "8"))
+MAX_INGESTS = int(os.getenv("INTELEXI_MAX_INGESTS", "2"))
+MAX_TRANSCRIBES = int(os.getenv("INTELEXI_MAX_TRANSCRIBES", "2"))
+QUEUE_LIMIT = int(os.getenv("INTELEXI_QUEUE_LIMIT", "32"))
+MAX_UPLOAD_MB = int(os.getenv("INTELEXI_MAX_UPLOAD_MB", "50"))
+
+
+class Gate:
+    """A semaphore that refuses (503) instead of queueing past `queue_limit` waiters."""
+
+    def __init__(self, name, limit, queue_limit=QUEUE_LIMIT):
+        self.name = name
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        if self._sem.locked() and self.waiting >= self.queue_limit:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                headers={"Retry-After": "1"},
+                text=json.dumps({"error": f"too many {self.name} requests"}),
+                content_type="application/json",
+            )
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._sem.release()
+        return False
+
+    def prometheus_lines(self):
+        return [
+            f'intelexi_gate_active{{gate="{self.name}"}} {self.active}',
+            f'intelexi_gate_waiting{{gate="{self.name}"}} {self.waiting}',
+            f'intelexi_gate_rejected_total{{gate="{self.name}"}} {self.rejected}',
+        ]
+
+
+def _session_id(request):
+    return request.match_info["session_id"]
+
+
+def _user(request):
+    return request.headers.get("X-Intelexi-User", "anonymous")
+
+
+@web.middleware
+async def library_errors(request, handler):
+    try:
+        return await handler(request)
+    except AccessDenied as exc:
+        raise web.HTTPForbidden(text=str(exc))
+    except UnknownCollection as exc:
+        raise web.HTTPNotFound(text=f"no such collection: {exc}")
+    except InvalidRequest as exc:
+        raise web.HTTPBadRequest(text=str(exc))
+
+
+async def _json_object(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="body must be a JSON object")
+    return body
+
+
+async def _read_files(request):
+    files = []
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename:
+            files.append(Upload(part.filename, bytes(await part.read())))
+    if not files:
+        raise web.HTTPBadRequest(text="no files in the upload")
+    return files
+
+
+async def upload(request):
+    engine = request.app["engine"]
+    files = await _read_files(request)
+    replace = request.query.get("replace") in ("1", "true")
+    async with request.app["gates"]["ingest"]:
+        result = await asyncio.to_thread(engine.ingest, _session_id(request), files, replace)
+    return web.json_response(result)
+
+
+async def ask(request):
+    engine = request.app["engine"]
+    body = await _json_object(request)
+    question = body.get("question")
+    question = question.strip() if isinstance(question, str) else ""
+    mode = body.get("mode", "text")
+    if not question or not isinstance(mode, str) or mode not in MODES:
+        raise web.HTTPBadRequest(text="need a question and a mode of " + ", ".join(MODES))
+
+    async with request.app["gates"]["ask"]:
+        if not body.get("stream"):
+            answer, branch = await engine.ask(_session_id(request), question, mode=mode)
+            return web.json_response({"answer": answer, "branch": branch})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        updates = asyncio.Queue()
+        task = asyncio.ensure_future(engine.ask(
+            _session_id(request), question, mode=mode, on_token=updates.put_nowait,
+        ))
+        task.add_done_callback(lambda _: updates.put_nowait(None))
+        try:
+            done = False
+            while not done:
+                text = await updates.get()
+                # only the newest text matters if the client reads slowly
+                while text is not None and not updates.empty():
+                    newer = updates.get_nowait()
+                    if newer is None:
+                        done = True
+                        break
+                    text = newer
+                if text is None:
+                    break
+                await response.write((json.dumps({"text": text}) + "\n").encode())
+            try:
+                answer, branch = task.result()
+            except Exception as exc:
+                # headers are already sent; the failure goes in the last line instead
+                await response.write((json.dumps({"error": f"{type(exc).__name__}: {exc}"}) + "\n").encode())
+            else:
+                await response.write((json.dumps({"answer": answer, "branch": branch}) + "\n").encode())
+        finally:
+            # client went away: stop the answer (and its LLM streams)
+            task.cancel()
+        await response.write_eof()
+        return response
+
+
+async def transcribe(request):
+    engine = request.app["engine"]
+    audio = await request.read()
+    if not audio:
+        raise web.HTTPBadRequest(text="empty audio")
+    profile = request.query.get("profile")
+    if profile is not None and profile not in PROFILES:
+        raise web.HTTPBadRequest(text="profile must be one of " + ", ".join(PROFILES))
+    async with request.app["gates"]["transcribe"]:
+        if request.query.get("long") == "1":
+            segments = await asyncio.to_thread(engine.transcribe_long, _session_id(request), audio, profile)
+            return web.json_response({"text": " ".join(seg["text"] for seg in segments), "segments": segments})
+        text = await asyncio.to_thread(engine.transcribe, _session_id(request), audio, profile)
+    return web.json_response({"text": text})
+
+
+async def attach(request):
+    body = await _json_object(request)
+    names = body.get("collections", [])
+    if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+        raise web.HTTPBadRequest(text='"collections" must be a list of collection names')
+    await asyncio.to_thread(request.app["engine"].attach, _session_id(request), _user(request), names)
+    return web.json_response({"collections": names})
+
+
+async def list_collections(request):
+    return web.json_response(request.app["engine"].library.collections(_user(request)))
+
+
+async def add_to_collection(request):
+    engine = request.app["engine"]
+    files = await _read_files(request)
+    async with request.app["gates"]["ingest"]:
+        result = await asyncio.to_thread(
+            engine.add_to_collection, _user(request), request.match_info["name"], files,
+        )
+    return web.json_response(result)
+
+
+async def grant(request):
+    body = await _json_object(request)
+    if not isinstance(body.get("user"), str) or not body["user"]:
+        raise web.HTTPBadRequest(text="need the user to grant access to")
+    request.app["engine"].library.grant(
+        request.match_info["name"], _user(request), body["user"], body.get("role", READ),
+    )
+    return web.json_response({"ok": True})
+
+
+async def delete_collection(request):
+    request.app["engine"].library.delete(request.match_info["name"], _user(request))
+    return web.json_response({"ok": True})
+
+
+async def drop_session(request):
+    return web.json_response({"dropped": request.app["engine"].drop_session(_session_id(request))})
+
+
+async def health(request):
+    engine = request.app["engine"]
+    return web.json_response({"ok": True, "sessions": engine.session_count(), "startup": engine.startup.snapshot()})
+
+
+async def metrics(request):
+    lines = [line for gate in request.app["gates"].values() for line in gate.prometheus_lines()]
+    batcher = request.app["engine"].query_batcher.stats()
+    lines.append(f"intelexi_query_batches_total {batcher['batches']}")
+    lines.append(f"intelexi_query_encodes_total {batcher['queries']}")
+    for key, value in request.app["engine"].llm.stats().items():
+        lines.append(f"intelexi_llm_{key}_total {value}")
+    answers = request.app["engine"].answers
+    if answers is not None:
+        stats = answers.stats()
+        lines.append(f"intelexi_answer_cache_hits_total {stats['hits']}")
+        lines.append(f"intelexi_answer_cache_misses_total {stats['misses']}")
+        lines.append(f"intelexi_answer_cache_entries {stats['entries']}")
+        lines.append(f"intelexi_answer_cache_hit_ratio {stats['hit_rate']}")
+    return web.Response(text=METRICS.prometheus_text() + "\n".join(lines) + "\n",
+                        content_type="text/plain")
+
+
+def make_app(engine=None):
+    app = web.Application(client_max_size=MAX_UPLOAD_MB * 2**20, middlewares=[library_errors])
+    app["engine"] = engine or Engine()
+    # models load in the background; requests before that just wait for them as before
+    app["engine"].warm_up()
+    app["gates"] = {
+        "ask": Gate("ask", MAX_ASKS),
+        "ingest": Gate("ingest", MAX_INGESTS),
+        "transcribe": Gate("transcribe", MAX_TRANSCRIBES),
+    }
+    app.router.add_post("/sessions/{session_id}/documents", upload)
+    app.router.add_post("/sessions/{session_id}/ask", ask)
+    app.router.add_post("/sessions/{session_id}/transcribe", transcribe)
+    app.router.add_put("/sessions/{session_id}/collections", attach)
+    app.router.add_delete("/sessions/{session_id}", drop_session)
+    app.router.add_get("/collections", list_collections)
+    app.router.add_post("/collections/{name}/documents", add_to_collection)
+    app.router.add_post("/collections/{name}/grants", grant)
+    app.router.add_delete("/collections/{name}", delete_collection)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    web.run_app(make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +0,0 @@
-def ask_model(client, model_name, prompt):
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
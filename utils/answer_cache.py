@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# cosine between question embeddings above which a stored answer is reused
+THRESHOLD = float(os.getenv("INTELEXI_ANSWER_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("INTELEXI_ANSWER_CACHE_SIZE", "2048"))
+TTL_SECONDS = float(os.getenv("INTELEXI_ANSWER_CACHE_TTL", "3600"))
+ENABLED = os.getenv("INTELEXI_ANSWER_CACHE", "1") != "0"
+
+_ANCHOR = re.compile(r"\w*\d\w*")
+
+
+def scope_key(*parts):
+    """One string for everything an answer depends on besides the question (documents, mode, model)."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _anchors(question):
+    # "clause 4.2" and "clause 4.3" embed almost identically; numbers must match exactly
+    return frozenset(_ANCHOR.findall(question.lower()))
+
+
+class AnswerCache:
+    """
+    Answers by (scope, question embedding). A question hits when an earlier
+    question in the same scope, with the same numbers in it, is within
+    `threshold` cosine; the stored answer comes back with the branch that
+    produced it. Least recently used entries go first past `max_entries`,
+    and entries older than `ttl` seconds are never returned.
+    """
+
+    def __init__(self, threshold=THRESHOLD, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # id -> (scope, vector, anchors, answer, branch, created)
+        self._scopes = {}              # scope -> {id: vector}, for the vectorised match
+        self._matrices = {}            # scope -> (ids, stacked vectors), rebuilt after changes
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, entry_id):
+        scope = self._entries.pop(entry_id)[0]
+        members = self._scopes[scope]
+        del members[entry_id]
+        if not members:
+            del self._scopes[scope]
+        self._matrices.pop(scope, None)
+
+    def get(self, scope, vector, question):
+        """(answer, branch) of the closest fresh match above the threshold, else None."""
+        anchors = _anchors(question)
+        with self._lock:
+            now = time.time()
+            best = None
+            if scope in self._scopes:
+                if scope not in self._matrices:
+                    ids = list(self._scopes[scope])
+                    self._matrices[scope] = (ids, np.stack([self._scopes[scope][i] for i in ids]))
+                ids, matrix = self._matrices[scope]
+                scores = matrix @ np.asarray(vector, dtype=np.float32)
+                for pos in np.argsort(-scores):
+                    if scores[pos] < self.threshold:
+                        break
+                    entry = self._entries[ids[pos]]
+                    if now - entry[5] > self.ttl:
+                        continue
+                    if entry[2] == anchors:
+                        best = ids[pos]
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            _, _, _, answer, branch, _ = self._entries[best]
+            return answer, branch
+
+    def put(self, scope, vector, question, answer, branch):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            now = time.time()
+            # expired entries first, then the least recently used
+            expired = [i for i, e in self._entries.items() if now - e[5] > self.ttl]
+            for entry_id in expired:
+                self._drop(entry_id)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, vector, _anchors(question), answer, branch, now)
+            self._scopes.setdefault(scope, {})[entry_id] = vector
+            self._matrices.pop(scope, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self._matrices.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
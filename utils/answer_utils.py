@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.tracing import annotate, span
+
+NOT_IN_DOC = "Information not in document"
+
+DOCUMENT = "document"
+WIKIPEDIA = "wikipedia"
+MODEL = "model"
+
+# seconds per stage; a stage that runs out is treated as "no answer"
+STAGE_TIMEOUTS = {DOCUMENT: 60.0, WIKIPEDIA: 8.0, MODEL: 60.0}
+
+WIKI_NOTE = "It’s not mentioned in the document, but here’s what I found:\n\n{summary}"
+WIKI_PROMPT = """
+Use this Wikipedia information if helpful — otherwise provide the correct answer.
+
+{summary}
+
+Question: {question}
+"""
+
+# Own pools rather than the loop's default executor: asyncio.run() waits for
+# the default executor on exit, and a cancelled Wikipedia lookup must not
+# hold the answer back. Lookups get a pool of their own: LLM pumps can sit
+# in the gateway's rate-limit wait for a long time, and a lookup queued
+# behind them would use up its timeout before it even started.
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="answer")
+_lookup_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="wiki")
+_DONE = object()
+
+
+class StageTimeout(Exception):
+    """A stage ran out of its STAGE_TIMEOUTS time (not an error raised by the LLM call itself)."""
+_TIMED_OUT = object()
+
+
+class _LLMStream:
+    """
+    One streaming LLM call pumped from a worker thread into the event loop.
+    Tokens are buffered until a listener is attached, so a speculative call
+    that wins later can replay what it already received.
+    """
+
+    def __init__(self, ask_stream, prompt):
+        self.cancel = threading.Event()
+        self.parts = []
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.listener = None
+        self.done = asyncio.get_running_loop().create_future()
+        # losing speculative calls may fail unobserved; that is fine
+        self.done.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.prompt_chars = len(prompt)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run(ask_stream, prompt))
+
+    def _pump(self, loop, ask_stream, prompt):
+        try:
+            for token in ask_stream(prompt, self.cancel):
+                loop.call_soon_threadsafe(self._queue.put_nowait, token)
+        except BaseException as exc:
+            loop.call_soon_threadsafe(self._queue.put_nowait, exc)
+            return
+        loop.call_soon_threadsafe(self._queue.put_nowait, _DONE)
+
+    async def _run(self, ask_stream, prompt):
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(_executor, self._pump, loop, ask_stream, prompt)
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.parts.append(item)
+                if self.listener is not None:
+                    self.listener("".join(self.parts))
+            self.done.set_result("".join(self.parts))
+        except asyncio.CancelledError:
+            self.done.cancel()
+        except BaseException as exc:
+            self.done.set_exception(exc)
+        finally:
+            self.cancel.set()
+
+    def attach(self, listener):
+        self.listener = listener
+        if listener is not None and self.parts:
+            listener("".join(self.parts))
+
+    async def result(self, timeout, stage):
+        with span(f"llm.{stage}", prompt_chars=self.prompt_chars) as sp:
+            try:
+                return await asyncio.wait_for(asyncio.shield(self.done), timeout)
+            except asyncio.TimeoutError:
+                self.stop()
+                # wait_for re-raises a TimeoutError from the call itself too; only ours is a stage timeout
+                if self.done.done() and not self.done.cancelled() and self.done.exception() is not None:
+                    raise
+                sp.set(timeout=True)
+                raise StageTimeout(f"{stage} stage took longer than {timeout:g} s") from None
+            except BaseException:
+                self.stop()
+                raise
+            finally:
+                sp.set(tokens=len(self.parts))
+                if self.first_token_at is not None:
+                    sp.set(ttft_ms=round((self.first_token_at - self.started) * 1000, 3))
+
+    def stop(self):
+        self.cancel.set()
+        self._task.cancel()
+
+
+def _hold_back(on_token, sentinel):
+    # show nothing while the text so far could still be the sentinel reply
+    if on_token is None:
+        return None
+    shown = []
+
+    def listener(text):
+        if not shown:
+            head = text.strip().strip('"').strip().rstrip(".")
+            if sentinel.startswith(head) or head.startswith(sentinel):
+                return
+            shown.append(True)
+        on_token(text)
+
+    return listener
+
+
+async def _lookup(wiki, question, timeout):
+    loop = asyncio.get_running_loop()
+    with span("wikipedia") as sp:
+        try:
+            summary = await asyncio.wait_for(loop.run_in_executor(_lookup_executor, wiki, question), timeout)
+        except asyncio.TimeoutError:
+            sp.set(timeout=True)
+            return _TIMED_OUT
+        sp.set(found=bool(summary))
+        return summary
+
+
+async def _summary(wiki_task, timed_out):
+    summary = await wiki_task
+    if summary is _TIMED_OUT:
+        timed_out.append(WIKIPEDIA)
+        return None
+    return summary
+
+
+async def answer_question(question, ask_stream, wiki, report=None, **kwargs):
+    """
+    Run the fallback chain and return (answer, branch); see _answer_question.
+    The branch taken is recorded on the current trace. If `report` (a dict)
+    is given, report["timed_out"] lists the stages that ran out of time on
+    the way to that branch: such an answer is a fallback, not a verdict.
+    """
+    timed_out = []
+    answer, branch = await _answer_question(question, ask_stream, wiki, timed_out=timed_out, **kwargs)
+    annotate(branch=branch)
+    if timed_out:
+        annotate(timed_out=",".join(timed_out))
+    if report is not None:
+        report["timed_out"] = timed_out
+    return answer, branch
+
+
+async def _answer_question(question, ask_stream, wiki, doc_prompt=None, wiki_note=WIKI_NOTE,
+                           wiki_prompt=WIKI_PROMPT, speculate_model=False, timeouts=None,
+                           on_token=None, timed_out=None):
+    """
+    Precedence is unchanged: with a document prompt, the document answer
+    wins unless it says NOT_IN_DOC, then a Wikipedia summary, then the
+    model's own answer; without one, a Wikipedia-grounded answer, then the
+    model's own answer. A stage that times out counts as no answer; any
+    other error from the LLM is raised to the caller. What changes is timing: the Wikipedia lookup (and,
+    with `speculate_model`, the plain model answer) start right away, in
+    parallel with the first stage, and losers are cancelled.
+
+    ask_stream(prompt, cancel_event) yields tokens; wiki(question) returns a
+    summary or None. on_token(text_so_far) is called on the caller's thread.
+    """
+    timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+    timed_out = [] if timed_out is None else timed_out
+    wiki_task = asyncio.ensure_future(_lookup(wiki, question, timeouts[WIKIPEDIA]))
+    model = _LLMStream(ask_stream, question) if speculate_model else None
+
+    async def model_answer():
+        stream = model or _LLMStream(ask_stream, question)
+        stream.attach(on_token)
+        return await stream.result(timeouts[MODEL], MODEL), MODEL
+
+    try:
+        if doc_prompt is not None:
+            doc = _LLMStream(ask_stream, doc_prompt)
+            doc.attach(_hold_back(on_token, NOT_IN_DOC))
+            try:
+                answer = await doc.result(timeouts[DOCUMENT], DOCUMENT)
+            except StageTimeout:
+                # out of time counts as "no answer"; an LLM error (auth, deadline,
+                # exhausted retries) is raised, not passed off as "not in the document"
+                timed_out.append(DOCUMENT)
+                answer = NOT_IN_DOC
+            if NOT_IN_DOC not in answer:
+                return answer, DOCUMENT
+
+            summary = await _summary(wiki_task, timed_out)
+            if summary:
+                return wiki_note.format(summary=summary), WIKIPEDIA
+            return await model_answer()
+
+        summary = await _summary(wiki_task, timed_out)
+        if summary:
+            grounded = _LLMStream(ask_stream, wiki_prompt.format(summary=summary, question=question))
+            grounded.attach(on_token)
+            return await grounded.result(timeouts[MODEL], WIKIPEDIA), WIKIPEDIA
+        return await model_answer()
+    finally:
+        wiki_task.cancel()
+        if model is not None:
+            model.stop()
@@ -0,0 +1,103 @@
+import html
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CHAT_PATH = os.getenv("INTELEXI_CHAT_DB", os.path.join("cache", "chat.sqlite"))
+# messages older than this are dropped, and a chat keeps at most its newest MAX_MESSAGES
+TTL_SECONDS = float(os.getenv("INTELEXI_CHAT_TTL", str(180 * 24 * 3600)))
+MAX_MESSAGES = int(os.getenv("INTELEXI_CHAT_MAX_MESSAGES", "2000"))
+# messages per page in the history view
+PAGE_SIZE = 20
+# messages shown in the "Recent conversation" panels
+RECENT_MESSAGES = 6
+
+
+class ChatStore:
+    """
+    Append-only chat log in SQLite: one row per message, keyed by
+    (session, seq) with seq counting up from 0 per session. Every read is a
+    range over that primary key, so the cost of a page does not depend on
+    how long the conversation is. Pruning only ever cuts the oldest end of
+    a chat: messages older than `ttl` seconds, and all but the newest
+    `max_messages` of each chat.
+    """
+
+    def __init__(self, path=DEFAULT_CHAT_PATH, ttl=TTL_SECONDS, max_messages=MAX_MESSAGES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session TEXT, seq INTEGER, role TEXT, message TEXT, created REAL, "
+            "PRIMARY KEY (session, seq)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_created ON messages(created)")
+        self._db.commit()
+
+    def _bounds(self, session):
+        # [first, next) seq still stored; both ends are primary-key lookups
+        first, last = self._db.execute(
+            "SELECT MIN(seq), MAX(seq) FROM messages WHERE session = ?", (session,)
+        ).fetchone()
+        return (0, 0) if last is None else (first, last + 1)
+
+    def append(self, session, *messages):
+        """append(session, ("user", q), ("assistant", a)) writes both in one transaction."""
+        now = time.time()
+        with self._lock:
+            seq = self._bounds(session)[1]
+            self._db.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                [(session, seq + i, role, message, now) for i, (role, message) in enumerate(messages)],
+            )
+            self._db.execute("DELETE FROM messages WHERE session = ? AND seq < ?",
+                             (session, seq + len(messages) - self.max_messages))
+            self._db.execute("DELETE FROM messages WHERE created < ?", (now - self.ttl,))
+            self._db.commit()
+
+    def clear(self, session):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE session = ?", (session,))
+            self._db.commit()
+
+    def count(self, session):
+        """Messages still stored for `session`."""
+        with self._lock:
+            first, stop = self._bounds(session)
+            return stop - first
+
+    def _range(self, session, start, stop):
+        # called with the lock held
+        return self._db.execute(
+            "SELECT role, message FROM messages WHERE session = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session, max(start, 0), stop),
+        ).fetchall()
+
+    def recent(self, session, n=RECENT_MESSAGES):
+        """The last `n` messages, oldest first."""
+        with self._lock:
+            stop = self._bounds(session)[1]
+            return self._range(session, stop - n, stop)
+
+    def page(self, session, page=0, page_size=PAGE_SIZE):
+        """Page 0 is the newest `page_size` messages; higher pages go back in time."""
+        with self._lock:
+            stop = self._bounds(session)[1] - page * page_size
+            return self._range(session, stop - page_size, stop)
+
+    def pages(self, session, page_size=PAGE_SIZE):
+        return max(1, -(-self.count(session) // page_size))
+
+
+def bubble_html(role, message):
+    # escaped, and on one line: a blank line or ``` fence in a message must not
+    # end the HTML block and swallow the bubbles after it
+    message = html.escape(message).replace("\n", "<br>")
+    if role == "user":
+        return f"<div class='user-bubble'><b>🧑 You:</b><br>{message}</div>"
+    return f"<div class='bot-bubble'><b>🤖 AI:</b><br>{message}</div>"
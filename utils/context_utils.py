@@ -0,0 +1,47 @@
+import os
+
+from utils.text_utils import count_tokens
+
+# context windows of the Groq models we use; unknown models get the smallest
+CONTEXT_WINDOWS = {
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_WINDOW = 8192
+# tokens of retrieved context per question (INTELEXI_CONTEXT_TOKENS); ~5-6 chunks of 200 words
+CONTEXT_TOKENS = int(os.getenv("INTELEXI_CONTEXT_TOKENS", "1500"))
+# room kept free for the instructions, the question and the answer
+RESERVED_TOKENS = 1024
+DUPLICATE_THRESHOLD = 0.8
+
+
+def _shingles(text, n=5):
+    words = text.lower().split()
+    return {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+
+
+def context_budget(model_name, budget=None):
+    window = CONTEXT_WINDOWS.get(model_name, DEFAULT_WINDOW)
+    return max(0, min(budget or CONTEXT_TOKENS, window - RESERVED_TOKENS))
+
+
+def pack_context(chunks, budget, threshold=DUPLICATE_THRESHOLD):
+    """
+    Fill `budget` tokens with chunks, best first (`chunks` must already be
+    sorted by score). A chunk whose 5-word shingles overlap an already
+    picked one by more than `threshold` (Jaccard) is a near-duplicate and
+    is skipped; so is a chunk that no longer fits. Returns the picked chunks.
+    """
+    picked, seen, used = [], [], 0
+    for chunk in chunks:
+        n = count_tokens(chunk)
+        if used + n > budget:
+            continue
+        sh = _shingles(chunk)
+        if any(len(sh & other) / len(sh | other) > threshold for other in seen):
+            continue
+        picked.append(chunk)
+        seen.append(sh)
+        used += n
+    return picked
@@ -0,0 +1,119 @@
+import numpy as np
+
+from utils.index_utils import build_index, grow
+from utils.retrieval_utils import HybridRetriever, chunk_features
+
+
+class Corpus:
+    """
+    Chunks + embeddings for the uploaded documents, with per-document
+    bookkeeping so an upload change only touches the files that changed.
+
+    docs maps a content fingerprint (sha256 of the PDF bytes) to
+    {"name", "start", "stop"}: the document's row range in `chunks` and
+    `embeddings`. Documents are kept contiguous and in upload order.
+    Embeddings are held in `dtype` (float16 halves session memory and is
+    lossless for vectors that came through the embedding cache), in a
+    buffer that doubles when full, so streaming a document in batch by
+    batch copies each row O(1) times. Rows appended after the index and
+    retriever were built are added to them on the next question instead
+    of rebuilding them.
+    """
+
+    def __init__(self, dtype="float16", index_kind=None):
+        self.docs = {}
+        self.chunks = []
+        self.features = []
+        self.dtype = np.dtype(dtype)
+        self.index_kind = index_kind
+        self.embeddings = np.zeros((0, 0), dtype=self.dtype)
+        self._buffer = self.embeddings
+        self._index = None
+        self._retriever = None
+        # rows the index / retriever already cover
+        self._indexed = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def diff(self, fingerprints):
+        """Return (added, removed) fingerprints relative to the current corpus."""
+        wanted = set(fingerprints)
+        added = [fp for fp in dict.fromkeys(fingerprints) if fp not in self.docs]
+        removed = [fp for fp in self.docs if fp not in wanted]
+        return added, removed
+
+    def remove(self, fingerprints):
+        drop = [self.docs[fp] for fp in fingerprints if fp in self.docs]
+        if not drop:
+            return
+        keep = np.ones(len(self.chunks), dtype=bool)
+        for doc in drop:
+            keep[doc["start"]:doc["stop"]] = False
+        self.chunks = [c for c, k in zip(self.chunks, keep) if k]
+        self.features = [f for f, k in zip(self.features, keep) if k]
+        self.embeddings = self._buffer = self.embeddings[keep]
+        self._index = self._retriever = None
+        self._indexed = 0
+        for fp in fingerprints:
+            self.docs.pop(fp, None)
+        self._renumber()
+
+    def add(self, fingerprint, name, chunks, embeddings):
+        # a document that yielded no text is remembered so it is not re-read
+        start = len(self.chunks)
+        self.docs[fingerprint] = {"name": name, "start": start, "stop": start + len(chunks)}
+        self._append_rows(chunks, embeddings)
+
+    def extend(self, fingerprint, chunks, embeddings):
+        """Append rows to the newest document (streaming ingest: searchable batch by batch)."""
+        doc = self.docs[fingerprint]
+        if doc["stop"] != len(self.chunks):
+            raise ValueError("only the most recently added document can grow")
+        self._append_rows(chunks, embeddings)
+        doc["stop"] = len(self.chunks)
+
+    def _append_rows(self, chunks, embeddings):
+        if len(chunks) == 0:
+            return
+        self.chunks.extend(chunks)
+        # boosts and term counts are computed here once, not per question
+        self.features.extend(chunk_features(c) for c in chunks)
+        embeddings = np.asarray(embeddings).astype(self.dtype, copy=False)
+        n = len(self.embeddings)
+        if n == 0:
+            self._buffer = embeddings.reshape(len(embeddings), -1)
+        else:
+            self._buffer = grow(self._buffer, n, embeddings)
+        self.embeddings = self._buffer[:n + len(embeddings)]
+
+    def index(self):
+        # built lazily; storage follows INTELEXI_INDEX_STORAGE
+        n = len(self.chunks)
+        if self._index is not None and self._indexed < n:
+            if self._index.kind == "exact" and self._index.vectors.storage != self.dtype.name:
+                # quantised copy: quantise only the new rows
+                self._index.append(self.embeddings[self._indexed:n])
+            else:
+                # same dtype: a new exact index is a view of the buffer, free to build;
+                # IVF cells have to be retrained
+                self._index = None
+        if self._index is None and n:
+            self._index = build_index(self.embeddings, kind=self.index_kind)
+        if self._retriever is not None and self._indexed < n:
+            self._retriever.append(self._index, self.features[self._indexed:n])
+        self._indexed = n
+        return self._index
+
+    def retriever(self):
+        index = self.index()
+        if self._retriever is None and len(self.chunks):
+            self._retriever = HybridRetriever(index, self.features)
+        return self._retriever
+
+    def _renumber(self):
+        start = 0
+        for doc in self.docs.values():
+            size = doc["stop"] - doc["start"]
+            doc["start"], doc["stop"] = start, start + size
+            start += size
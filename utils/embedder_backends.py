@@ -0,0 +1,275 @@
+"""
+Embedding backends for all-MiniLM-L6-v2, all with SentenceTransformer's
+encode(texts, batch_size=..., convert_to_tensor=False) signature:
+
+    torch      sentence-transformers on PyTorch (the original path)
+    onnx       ONNX Runtime + Rust tokenizer, no torch import
+    onnx-int8  the same graph with dynamically int8-quantized weights
+
+Pick one with INTELEXI_EMBED_BACKEND and the intra-op threads with
+INTELEXI_EMBED_THREADS. Compare a backend against torch with
+
+    python -m utils.embedder_backends --backend onnx-int8 [some.pdf ...]
+"""
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+
+BACKEND = os.getenv("INTELEXI_EMBED_BACKEND", "torch")
+# 0 = let the runtime decide (all cores)
+THREADS = int(os.getenv("INTELEXI_EMBED_THREADS", "0")) or None
+# padded tokens per ONNX batch: short chunks go in big batches, long ones in small
+TOKENS_PER_BATCH = int(os.getenv("INTELEXI_EMBED_TOKENS_PER_BATCH", "8192"))
+MAX_BATCH = 256
+# all-MiniLM-L6-v2's max_seq_length
+MAX_LENGTH = 256
+ONNX_DIR = os.path.join("models", "onnx")
+# a backend whose vectors agree this closely with torch shares torch's cache
+COMPATIBLE_COSINE = 0.999
+
+PROBE_TEXTS = [
+    "Clause 4.2.1 sets out the overtime rate for night shifts.",
+    "The preamble describes the purpose of the agreement.",
+    "Photosynthesis converts light energy into chemical energy.",
+    "Error E-1042 means the device lost its network connection.",
+    "Employees must submit leave requests two weeks in advance.",
+    "What is the capital of France?",
+    "A short one.",
+    "Long documents are split into chunks of roughly two hundred words before they are embedded, "
+    "so that each vector describes one passage instead of a whole file.",
+]
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+class OnnxEmbedder:
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime: tokenise everything once, sort by
+    length, cut batches by a padded-token budget (so padding stays small
+    and long chunks don't blow up memory), run, mean-pool, restore order.
+    `model_dir` needs model.onnx and tokenizer.json; they are fetched from
+    the Hugging Face hub on first use unless INTELEXI_ONNX_DIR points at them.
+    """
+
+    def __init__(self, model_name, quantize=False, threads=THREADS, model_dir=None,
+                 tokens_per_batch=TOKENS_PER_BATCH, max_length=MAX_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.backend = "onnx-int8" if quantize else "onnx"
+        self.tokens_per_batch = tokens_per_batch
+        model_dir = model_dir or os.getenv("INTELEXI_ONNX_DIR") or _fetch_onnx(model_name)
+        model_path = os.path.join(model_dir, "model.onnx")
+        if quantize:
+            model_path = _quantized(model_path)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        # one request at a time per session; parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def batches(self, lengths, max_batch=MAX_BATCH):
+        """Index batches over `lengths`, longest first, each within the padded-token budget."""
+        order = np.argsort(-np.asarray(lengths), kind="stable")
+        batch = []
+        for i in order:
+            # sorted descending, so the first item sets the batch's padded length
+            width = lengths[batch[0]] if batch else lengths[i]
+            if batch and (len(batch) + 1) * width > self.tokens_per_batch or len(batch) == max_batch:
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def encode(self, texts, batch_size=None, convert_to_tensor=False, **_):
+        if isinstance(texts, str):
+            texts = [texts]
+        encodings = self.tokenizer.encode_batch(list(texts))
+        lengths = [len(e.ids) for e in encodings]
+        out = None
+        for batch in self.batches(lengths, max_batch=batch_size or MAX_BATCH):
+            width = max(lengths[i] for i in batch)
+            ids = np.zeros((len(batch), width), dtype=np.int64)
+            mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                ids[row, :lengths[i]] = encodings[i].ids
+                mask[row, :lengths[i]] = 1
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.inputs:
+                feed["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feed)[0]
+            # mean pooling over real tokens, as sentence-transformers does
+            m = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            if out is None:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[batch] = pooled
+        if out is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+
+def _fetch_onnx(model_name):
+    from huggingface_hub import hf_hub_download
+
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    local = os.path.join(ONNX_DIR, _slug(model_name))
+    os.makedirs(local, exist_ok=True)
+    for remote, name in (("onnx/model.onnx", "model.onnx"), ("tokenizer.json", "tokenizer.json")):
+        target = os.path.join(local, name)
+        if not os.path.exists(target):
+            path = hf_hub_download(repo, remote)
+            tmp = target + ".tmp"
+            with open(path, "rb") as src, open(tmp, "wb") as dst:
+                dst.write(src.read())
+            os.replace(tmp, target)
+    return local
+
+
+def _quantized(model_path):
+    # dynamic quantization: int8 weights, activations quantized on the fly; done once, kept on disk
+    target = model_path[:-len(".onnx")] + "_int8.onnx"
+    if not os.path.exists(target):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = target[:-len(".onnx")] + ".tmp.onnx"
+        quantize_dynamic(model_path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, target)
+    return target
+
+
+def load_torch(model_name, threads=THREADS):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        torch.set_num_threads(threads)
+    # encode() already sorts by length inside each call
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def load_embedder(model_name, backend=None, threads=THREADS):
+    backend = backend or BACKEND
+    if backend == "torch":
+        return load_torch(model_name, threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(model_name, quantize=backend == "onnx-int8", threads=threads)
+    raise ValueError(f"unknown embedding backend {backend!r}")
+
+
+def backend_of(model):
+    backend = getattr(model, "backend", "torch")
+    return backend if isinstance(backend, str) else "torch"
+
+
+def _probe(model):
+    emb = np.asarray(model.encode(PROBE_TEXTS, convert_to_tensor=False), dtype=np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def cache_namespace(cache_root, model_name, model):
+    """
+    The EmbeddingCache name for vectors from `model`. Torch vectors use the
+    model name (as before) and leave probe vectors next to the cache; any
+    other backend shares that cache only if it reproduces those probes to
+    COMPATIBLE_COSINE, otherwise it gets its own "<model>@<backend>" cache,
+    so a cache never mixes vectors from different numerics.
+    """
+    backend = backend_of(model)
+    probe_path = os.path.join(cache_root, _slug(model_name), "probe.npy")
+    if backend == "torch":
+        if not os.path.exists(probe_path):
+            os.makedirs(os.path.dirname(probe_path), exist_ok=True)
+            np.save(probe_path, _probe(model))
+        return model_name
+    if os.path.exists(probe_path):
+        reference, probe = np.load(probe_path), _probe(model)
+        if reference.shape == probe.shape and np.min(np.sum(reference * probe, axis=1)) >= COMPATIBLE_COSINE:
+            return model_name
+    return f"{model_name}@{backend}"
+
+
+def compare(reference, candidate, texts, queries=None, k=5, repeat=3):
+    """
+    Accuracy and throughput of `candidate` against `reference` on `texts`:
+    per-text cosine between the two vectors, and how often the top-k
+    chunks for each query (default: the texts themselves) agree.
+    """
+    def timed(model):
+        best = float("inf")
+        for _ in range(repeat):
+            t = time.perf_counter()
+            emb = np.asarray(model.encode(texts, convert_to_tensor=False), dtype=np.float32)
+            best = min(best, time.perf_counter() - t)
+        return emb / np.linalg.norm(emb, axis=1, keepdims=True), best
+
+    ref, ref_s = timed(reference)
+    cand, cand_s = timed(candidate)
+    cos = np.sum(ref * cand, axis=1)
+    q_ref = ref if queries is None else _probe_queries(reference, queries)
+    q_cand = cand if queries is None else _probe_queries(candidate, queries)
+    overlap = []
+    for qr, qc in zip(q_ref, q_cand):
+        a = set(np.argsort(-(ref @ qr))[:k])
+        b = set(np.argsort(-(cand @ qc))[:k])
+        overlap.append(len(a & b) / len(a))
+    return {
+        "texts": len(texts),
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_mean": round(float(cos.mean()), 5),
+        f"top{k}_overlap": round(float(np.mean(overlap)), 4),
+        "reference_texts_per_s": round(len(texts) / ref_s, 1),
+        "candidate_texts_per_s": round(len(texts) / cand_s, 1),
+        "speedup": round(ref_s / cand_s, 2),
+    }
+
+
+def _probe_queries(model, queries):
+    emb = np.asarray(model.encode(queries, convert_to_tensor=False), dtype=np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend with the torch path.")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to chunk for the comparison (default: synthetic text)")
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--threads", type=int, default=THREADS)
+    parser.add_argument("--cache-root", default=os.path.join("cache", "embeddings"),
+                        help="where the torch probe vectors live (for the cache compatibility check)")
+    args = parser.parse_args()
+
+    from utils import pdf_utils
+    from utils.text_utils import stream_chunks
+
+    if args.pdfs:
+        # chunked the way ingest does it
+        texts = [chunk for _, pages in pdf_utils.iter_documents(args.pdfs) for chunk in stream_chunks(pages)]
+    else:
+        # 512 passages of 5-124 words, like a mix of headings and full chunks
+        words = " ".join(PROBE_TEXTS).split()
+        texts = [" ".join(words[j % len(words)] for j in range(i, i + 5 + i * 7 % 120)) for i in range(512)]
+    reference = load_torch(args.model, args.threads)
+    candidate = load_embedder(args.model, args.backend, args.threads)
+    report = compare(reference, candidate, texts)
+    cache_namespace(args.cache_root, args.model, reference)  # records the torch probes if missing
+    report["cache"] = cache_namespace(args.cache_root, args.model, candidate)
+    for key, value in report.items():
+        print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+SHARD_ROWS = 4096
+
+
+def normalize_chunk(text):
+    return " ".join(text.split())
+
+
+def chunk_key(text):
+    return hashlib.sha256(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of chunk embeddings for one model.
+
+    Layout under <root>/<model>/:
+        shard_00000.bin ...  raw rows of `dim` values (float16 by default)
+        index.tsv            append-only "<sha256>\\t<shard>\\t<row>" lines
+    Rows are written before their index lines, so a crash mid-write can only
+    leave unreferenced bytes at the end of a shard, never a bad lookup.
+    """
+
+    def __init__(self, root, model_name, dtype="float16", shard_rows=SHARD_ROWS):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.model_name = model_name
+        self.path = os.path.join(root, slug)
+        self.dtype = np.dtype(dtype)
+        self.shard_rows = shard_rows
+        self.dim = None
+        self._index = {}
+        self._index_size = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._read_meta()
+        self._refresh_index()
+
+    # ---- files
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.txt")
+
+    def _index_path(self):
+        return os.path.join(self.path, "index.tsv")
+
+    def _shard_path(self, shard):
+        return os.path.join(self.path, f"shard_{shard:05d}.bin")
+
+    def _read_meta(self):
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path()) as fh:
+                dim, dtype = fh.read().split()
+            self.dim = int(dim)
+            self.dtype = np.dtype(dtype)
+
+    def _write_meta(self, dim):
+        self.dim = dim
+        with open(self._meta_path(), "w") as fh:
+            fh.write(f"{dim} {self.dtype.name}\n")
+
+    def _refresh_index(self):
+        # Pick up entries appended by other sessions / processes.
+        path = self._index_path()
+        if not os.path.exists(path) or os.path.getsize(path) == self._index_size:
+            return
+        with open(path) as fh:
+            fh.seek(self._index_size)
+            data = fh.read()
+        # ignore a trailing partial line from a concurrent writer
+        end = data.rfind("\n") + 1
+        for line in data[:end].splitlines():
+            key, shard, row = line.split("\t")
+            self._index[key] = (int(shard), int(row))
+        self._index_size += len(data[:end].encode("utf-8"))
+
+    def _shard(self, shard):
+        m = self._maps.get(shard)
+        rows = os.path.getsize(self._shard_path(shard)) // (self.dim * self.dtype.itemsize)
+        if m is None or len(m) < rows:
+            m = np.memmap(self._shard_path(shard), dtype=self.dtype, mode="r", shape=(rows, self.dim))
+            self._maps[shard] = m
+        return m
+
+    # ---- public API
+    def __len__(self):
+        return len(self._index)
+
+    def get_many(self, keys):
+        """Return ({position: vector}, [missing positions]) for a list of keys."""
+        with self._lock:
+            self._refresh_index()
+            found, missing = {}, []
+            for pos, key in enumerate(keys):
+                loc = self._index.get(key)
+                if loc is None:
+                    missing.append(pos)
+                else:
+                    found[pos] = np.asarray(self._shard(loc[0])[loc[1]], dtype=np.float32)
+            return found, missing
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors)
+        if len(keys) == 0:
+            return
+        with self._lock, open(os.path.join(self.path, ".lock"), "w") as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            self._refresh_index()
+            if self.dim is None:
+                self._write_meta(vectors.shape[1])
+            new = [(k, v) for k, v in zip(keys, vectors) if k not in self._index]
+            if not new:
+                return
+            shard = 0
+            while os.path.exists(self._shard_path(shard + 1)):
+                shard += 1
+            row_bytes = self.dim * self.dtype.itemsize
+            lines = []
+            pos = 0
+            while pos < len(new):
+                path = self._shard_path(shard)
+                row = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+                take = min(self.shard_rows - row, len(new) - pos)
+                if take <= 0:
+                    shard += 1
+                    continue
+                block = np.stack([v for _, v in new[pos:pos + take]]).astype(self.dtype)
+                with open(path, "ab") as fh:
+                    fh.seek(row * row_bytes)
+                    fh.truncate()  # drop any orphan bytes from an interrupted write
+                    fh.write(block.tobytes())
+                for i, (key, _) in enumerate(new[pos:pos + take]):
+                    lines.append(f"{key}\t{shard}\t{row + i}\n")
+                pos += take
+            with open(self._index_path(), "a") as fh:
+                fh.write("".join(lines))
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._refresh_index()
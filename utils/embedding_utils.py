@@ -0,0 +1,28 @@
+import numpy as np
+
+from utils.embedding_cache import chunk_key
+
+
+def _encode(model, chunks, batch_size):
+    emb = model.encode(chunks, batch_size=batch_size, convert_to_tensor=False)
+    emb = np.asarray(emb, dtype=np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def embed_chunks(model, chunks, cache=None, batch_size=64):
+    if cache is None:
+        return _encode(model, chunks, batch_size)
+
+    # only encode the chunks the cache has never seen
+    keys = [chunk_key(c) for c in chunks]
+    found, missing = cache.get_many(keys)
+    if missing:
+        fresh = _encode(model, [chunks[i] for i in missing], batch_size)
+        cache.put_many([keys[i] for i in missing], fresh)
+        # round-trip through the storage dtype so hits and misses match exactly
+        fresh = fresh.astype(cache.dtype).astype(np.float32)
+        for i, vec in zip(missing, fresh):
+            found[i] = vec
+    if not found:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[i] for i in range(len(chunks))])
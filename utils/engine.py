@@ -0,0 +1,612 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import pdf_utils
+from utils.answer_cache import ENABLED as ANSWER_CACHE_ENABLED, AnswerCache, scope_key
+from utils.answer_utils import WIKI_NOTE, answer_question
+from utils.context_utils import context_budget, pack_context
+from utils.corpus_utils import Corpus
+from utils.embedder_backends import cache_namespace, load_embedder
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_utils import embed_chunks
+from utils.library_utils import DocumentLibrary
+from utils.llm_gateway import LLMGateway, make_client
+from utils.model_registry import ModelRegistry
+from utils.query_batcher import QueryBatcher
+from utils.text_utils import count_tokens, stream_chunks
+from utils.tracing import annotate, span, start_trace
+from utils.transcript_cache import TranscriptCache, transcript_key
+from utils.warmup import StartupReport, warm_up
+from utils.whisper_utils import (DEFAULT_PROFILE, INITIAL_PROMPT, LONG_WORKERS, transcribe_long,
+                                 transcribe_segments)
+from utils.wikipedia_utils import wiki_search
+
+MODEL_NAME = "llama-3.1-8b-instant"
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_CACHE_DIR = os.path.join("cache", "embeddings")
+WHISPER_MODEL_NAME = "tiny"
+# candidates fetched per question; pack_context keeps what fits the token budget
+RETRIEVE_K = 10
+# chunks embedded and made searchable together while a document streams in
+INGEST_BATCH = int(os.getenv("INTELEXI_INGEST_BATCH", "256"))
+# questions retrieved together by ask_batch (bounds the questions x chunks score matrix)
+BATCH_BLOCK = 256
+# sessions (one corpus each) kept in memory; idle ones are dropped first
+MAX_SESSIONS = int(os.getenv("INTELEXI_MAX_SESSIONS", "64"))
+SESSION_IDLE_SECONDS = float(os.getenv("INTELEXI_SESSION_IDLE_SECONDS", "3600"))
+
+VOICE_DOC_PROMPT = """
+You are an AI assistant. Answer the question ONLY using the provided document context.
+Provide a detailed answer in 3–5 sentences by explaining each term clearly.
+If the answer is not found, respond: "Information not in document."
+
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+"""
+
+TEXT_DOC_PROMPT = """
+You are an AI assistant. Answer the question using ONLY the provided document context.
+Give a detailed explanation in 3–5 sentences.
+Expand the meaning of concepts from the document.
+If the answer is not found, respond with: "Information not in document."
+
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+"""
+
+# mode -> (document prompt, how a Wikipedia fallback is introduced)
+MODES = {
+    "voice": (VOICE_DOC_PROMPT, WIKI_NOTE),
+    "text": (TEXT_DOC_PROMPT, "It’s not mentioned in the document, but here’s what Wikipedia says:\n\n{summary}"),
+}
+
+
+class Upload:
+    """A PDF received as raw bytes (HTTP upload, CLI), shaped like Streamlit's UploadedFile."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.size = len(data)
+        self._data = data
+
+    def getvalue(self):
+        return self._data
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.corpus = Corpus()
+        # library collections searched next to the session's own uploads
+        self.user = None
+        self.collections = []
+        # guards the corpus; held per batch, so retrieval runs during a long ingest
+        self.lock = threading.Lock()
+        # one ingest per session at a time (documents must stay contiguous)
+        self.ingest_lock = threading.Lock()
+        self.signature = None
+        self.last_trace = None
+        self.last_used = time.time()
+
+
+def default_registry():
+    # loaders import lazily so the service starts without torch until first use
+    registry = ModelRegistry()
+
+    def load_whisper():
+        from faster_whisper import WhisperModel
+        return WhisperModel(WHISPER_MODEL_NAME,
+            device="cpu",          # no GPU needed
+            compute_type="int8",   # prevents meta-tensor error
+            cpu_threads=2,         # safe for cloud
+            num_workers=LONG_WORKERS,  # pieces of a long recording decode in parallel
+            download_root="models" # cached download
+        )
+
+    # torch, onnx or onnx-int8 (INTELEXI_EMBED_BACKEND)
+    registry.register("embedder", lambda: load_embedder(EMBED_MODEL_NAME))
+    # CTranslate2 handles concurrent transcribe calls itself
+    registry.register("whisper", load_whisper, serialize=False)
+    return registry
+
+
+class Engine:
+    """
+    The ingest / retrieve / answer / transcribe pipeline, independent of any
+    UI. One Engine per process is shared by every user: models, the
+    embedding cache, the document library and the Groq client are
+    process-wide; each session id gets its own corpus for private uploads
+    and may attach library collections. Safe to call from several threads at once; `ask`
+    is a coroutine so an asyncio server can run many answers concurrently.
+    """
+
+    def __init__(self, client=None, model_name=MODEL_NAME, registry=None, cache=None,
+                 library=None, speculate_model=None, max_sessions=MAX_SESSIONS,
+                 session_idle_seconds=SESSION_IDLE_SECONDS, transcripts=None, answers=None, llm=None,
+                 wiki=None):
+        init_started = time.perf_counter()
+        self.startup = StartupReport()
+        if client is None:
+            client = lambda: make_client(os.getenv("GROQ_API_KEY", ""))
+        self.model_name = model_name
+        # every LLM call of the process: shared slots, rate limits, retries, fallback model;
+        # `client` may be a factory, so the Groq SDK is only imported when first needed
+        self.llm = llm or LLMGateway(client, model_name)
+        # wiki(question) -> summary or None, the fallback after the documents
+        self.wiki = wiki or (lambda q: wiki_search(q, sentences=4))
+        self.registry = registry or default_registry()
+        # opened with the first embedding, once we know which backend's vectors it holds
+        self._cache = cache
+        self.library = library or DocumentLibrary()
+        # a clip Streamlit hands us again on a rerun is not decoded again
+        self.transcripts = transcripts or TranscriptCache()
+        # repeated / paraphrased questions on the same documents skip retrieval and the LLM
+        if answers is None and ANSWER_CACHE_ENABLED:
+            answers = AnswerCache()
+        self.answers = answers
+        if speculate_model is None:
+            speculate_model = os.getenv("INTELEXI_SPECULATE_MODEL", "") == "1"
+        self.speculate_model = speculate_model
+        self.max_sessions = max_sessions
+        self.session_idle_seconds = session_idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # questions from all sessions share batched forward passes
+        self.query_batcher = QueryBatcher(self.embedder)
+        self._warmup = None
+        self.startup.mark("engine_init_ms", (time.perf_counter() - init_started) * 1000)
+
+    @property
+    def client(self):
+        return self.llm.client
+
+    def warm_up(self, parts=None):
+        """
+        Preload (and run once) the models and libraries in `parts` (default
+        INTELEXI_WARMUP) on a background thread; idempotent. Timings land in
+        `self.startup`.
+        """
+        with self._lock:
+            if self._warmup is None:
+                self._warmup = threading.Thread(target=warm_up, args=(self, parts), name="warm-up", daemon=True)
+                self._warmup.start()
+        return self._warmup
+
+    # ---- sessions -------------------------------------------------------
+
+    def session(self, session_id):
+        now = time.time()
+        with self._lock:
+            s = self._sessions.pop(session_id, None) or Session(session_id)
+            s.last_used = now
+            self._sessions[session_id] = s
+            # oldest first: drop idle sessions, then enforce the cap
+            for sid, other in list(self._sessions.items()):
+                if sid != session_id and (now - other.last_used > self.session_idle_seconds
+                                          or len(self._sessions) > self.max_sessions):
+                    del self._sessions[sid]
+        return s
+
+    def drop_session(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def session_count(self):
+        return len(self._sessions)
+
+    # ---- models ---------------------------------------------------------
+
+    def embedder(self):
+        return self.registry.get("embedder")
+
+    def embedding_cache(self):
+        with self._lock:
+            if self._cache is None:
+                name = cache_namespace(EMBED_CACHE_DIR, EMBED_MODEL_NAME, self.embedder())
+                self._cache = EmbeddingCache(EMBED_CACHE_DIR, name)
+            return self._cache
+
+    def whisper(self):
+        return self.registry.get("whisper")
+
+    def ask_stream(self, prompt, cancel):
+        return self.llm.stream(prompt, cancel=cancel)
+
+    # ---- pipeline -------------------------------------------------------
+
+    def ingest(self, session_id, files, replace=True, backend="pdfplumber"):
+        """
+        Bring the session's corpus in line with `files`. With `replace`,
+        documents not in `files` are dropped (a Streamlit uploader sends its
+        whole list every rerun); otherwise `files` are only added.
+        New documents stream in INGEST_BATCH chunks at a time and each batch
+        is searchable as soon as it is embedded, so questions on the session
+        can run while a big upload is still being read.
+        Returns {"skipped", "added", "removed", "failed", "documents", "chunks"}.
+        """
+        s = self.session(session_id)
+        # cheap check first: same names and sizes as last time → nothing to do
+        signature = [(pdf_utils.file_name(f), getattr(f, "size", None)) for f in files]
+        with s.ingest_lock:
+            result = {"skipped": replace and signature == s.signature,
+                      "added": 0, "removed": 0, "failed": []}
+            if not result["skipped"]:
+                with start_trace("upload", files=len(files)) as trace:
+                    self._ingest(s, files, replace, backend, result)
+                if replace:
+                    s.signature = signature
+                if trace is not None:
+                    s.last_trace = trace.to_dict()
+            with s.lock:
+                result.update(documents=len(s.corpus.docs), chunks=len(s.corpus))
+        return result
+
+    def _ingest(self, s, files, replace, backend, result):
+        # 🔥 CHANGED: only touch documents whose content was added or removed
+        with span("fingerprint"):
+            fingerprints = [pdf_utils.fingerprint(f) for f in files]
+            with s.lock:
+                added, removed = s.corpus.diff(fingerprints)
+                if replace:
+                    s.corpus.remove(removed)
+                    result["removed"] = len(removed)
+        # the pool extracts the next files while this one is chunked and embedded
+        documents = pdf_utils.iter_documents([files[fingerprints.index(fp)] for fp in added], backend=backend)
+        for fp, (f, texts) in zip(added, documents):
+            name = pdf_utils.file_name(f)
+            with s.lock:
+                s.corpus.add(fp, name, [], None)
+            try:
+                for chunks, emb in self._stream_document(f, backend, texts):
+                    # the lock is only held to append, so questions interleave with the upload
+                    with s.lock:
+                        s.corpus.extend(fp, chunks, emb)
+            except Exception:
+                # a half-read document is dropped, but remembered so it is not re-read
+                with s.lock:
+                    s.corpus.remove([fp])
+                    s.corpus.add(fp, name, [], None)
+            with s.lock:
+                doc = s.corpus.docs[fp]
+                if doc["stop"] == doc["start"]:
+                    result["failed"].append(name)
+        result["added"] = len(added)
+
+    def _stream_document(self, f, backend, texts=None):
+        """
+        Yield (chunks, embeddings) batches for one PDF: pages → chunks →
+        INGEST_BATCH-sized embedding batches. Only the current batch and the
+        pages still in flight are held, whatever the size of the document.
+        `texts` is the file's page texts if already being extracted
+        (iter_documents); by default they are read here.
+        """
+        if texts is None:
+            texts = pdf_utils.iter_pages(f, backend=backend)
+        with span("document", file=pdf_utils.file_name(f)) as sp:
+            pages = chunks = 0
+
+            def counted(page_texts):
+                nonlocal pages
+                for text in page_texts:
+                    pages += 1
+                    yield text
+
+            batch = []
+            for chunk in stream_chunks(counted(texts)):
+                batch.append(chunk)
+                if len(batch) == INGEST_BATCH:
+                    yield batch, self._embed(batch)
+                    chunks += len(batch)
+                    batch = []
+            if batch:
+                yield batch, self._embed(batch)
+                chunks += len(batch)
+            sp.set(pages=pages, chunks=chunks)
+
+    def _embed(self, chunks):
+        with span("embed", chunks=len(chunks)):
+            return embed_chunks(self.embedder(), chunks, cache=self.embedding_cache())
+
+    def _read_document(self, f, backend):
+        """The whole document as (chunks, embeddings); raises if it can't be read."""
+        chunks, embs = [], []
+        for batch, emb in self._stream_document(f, backend):
+            chunks.extend(batch)
+            embs.append(emb)
+        return chunks, (np.concatenate(embs) if embs else None)
+
+    # ---- shared library -------------------------------------------------
+
+    def add_to_collection(self, user, name, files, backend="pdfplumber"):
+        """
+        Read `files` into library collection `name` (created, owned by
+        `user`, if missing). Documents it already holds are not re-read;
+        each new document is committed as soon as it is embedded.
+        """
+        if not self.library.exists(name):
+            self.library.create(name, user)
+        added, failed = 0, []
+        with start_trace("upload", files=len(files), collection=name):
+            with span("fingerprint"):
+                fingerprints = [pdf_utils.fingerprint(f) for f in files]
+                have = self.library.known(name, fingerprints)
+            for fp, f in zip(fingerprints, files):
+                if fp in have:
+                    continue
+                try:
+                    chunks, emb = self._read_document(f, backend)
+                except Exception:
+                    chunks, emb = [], None
+                if not chunks:
+                    failed.append(pdf_utils.file_name(f))
+                    continue
+                added += self.library.add_documents(name, user, [(fp, pdf_utils.file_name(f), chunks, emb)])
+        return {"added": added, "failed": failed}
+
+    def publish(self, session_id, user, name):
+        """Copy the session's uploads into a library collection, embeddings included."""
+        s = self.session(session_id)
+        if not self.library.exists(name):
+            self.library.create(name, user)
+        with s.lock:
+            corpus = s.corpus
+            docs = [(fp, d["name"], corpus.chunks[d["start"]:d["stop"]], corpus.embeddings[d["start"]:d["stop"]])
+                    for fp, d in corpus.docs.items()]
+        return self.library.add_documents(name, user, docs)
+
+    def attach(self, session_id, user, names):
+        """Search these collections (which `user` must be able to read) for this session's questions."""
+        for name in names:
+            self.library.open(name, user)
+        s = self.session(session_id)
+        s.user, s.collections = user, list(names)
+
+    def _sources(self, s):
+        # (retriever, texts(rows)) for the session's uploads and each attached collection
+        sources = []
+        if len(s.corpus):
+            chunks = s.corpus.chunks
+            sources.append((s.corpus.retriever(), lambda rows: [chunks[i] for i in rows]))
+        for name in s.collections:
+            # reopened per question: picks up new documents and revoked access
+            collection = self.library.open(name, s.user)
+            if len(collection):
+                sources.append((collection.retriever(), collection.texts))
+        return sources
+
+    def answer_scope(self, session_id, mode="text"):
+        """What a cached answer depends on: the session's documents and collection versions, mode and model."""
+        s = self.session(session_id)
+        with s.lock:
+            docs = sorted(s.corpus.docs)
+            rows = len(s.corpus)
+            collections = [(name, self.library.open(name, s.user).version) for name in s.collections]
+        return scope_key(self.model_name, mode, docs, rows, collections)
+
+    def doc_prompt(self, session_id, question, mode="text", query_emb=None):
+        """Retrieve and pack the context for `question`; None when the session has no documents."""
+        s = self.session(session_id)
+        with s.lock:
+            sources = self._sources(s)
+            if not sources:
+                return None
+            with span("retrieve", k=RETRIEVE_K, sources=len(sources)):
+                if query_emb is None:
+                    query_emb = self.query_batcher.encode(question)
+                hits = []
+                for retriever, texts in sources:
+                    ids, scores = retriever.search(query_emb, question, RETRIEVE_K)
+                    hits.extend(zip(scores.tolist(), texts(ids)))
+        return self._build_prompt(question, hits, mode)
+
+    def _build_prompt(self, question, hits, mode):
+        # best first across sources; sort is stable, so ties keep source order
+        hits.sort(key=lambda h: -h[0])
+        top_chunks = [text for _, text in hits[:RETRIEVE_K]]
+        # dedup + pack the best chunks into the token budget
+        with span("build_context") as sp:
+            picked = pack_context(top_chunks, context_budget(self.model_name))
+            prompt = MODES[mode][0].format(context="\n\n".join(picked), question=question)
+            sp.set(chunks_used=len(picked), prompt_tokens=count_tokens(prompt))
+        return prompt
+
+    def doc_prompts(self, session_id, questions, query_embs, mode="text"):
+        """doc_prompt() for many questions at once: one matrix product per source for the whole block."""
+        s = self.session(session_id)
+        with s.lock:
+            sources = self._sources(s)
+            if not sources:
+                return [None] * len(questions)
+            hits = [[] for _ in questions]
+            for retriever, texts in sources:
+                for h, (ids, scores) in zip(hits, retriever.search_many(query_embs, questions, RETRIEVE_K)):
+                    h.extend(zip(scores.tolist(), texts(ids)))
+        return [self._build_prompt(q, h, mode) for q, h in zip(questions, hits)]
+
+    def _cached_answer(self, session_id, question, mode):
+        # (hit or None, scope, query embedding); the embedding is reused for retrieval on a miss
+        with span("answer_cache") as sp:
+            scope = self.answer_scope(session_id, mode)
+            query_emb = self.query_batcher.encode(question)
+            hit = self.answers.get(scope, query_emb, question)
+            sp.set(hit=hit is not None)
+        return hit, scope, query_emb
+
+    def _cacheable(self, answer, report):
+        # a fallback reached because a stage ran out of time says nothing about the
+        # documents; it must not be served to every session on them for the whole TTL
+        return self.answers is not None and bool(answer.strip()) and not report.get("timed_out")
+
+    async def ask(self, session_id, question, mode="text", on_token=None):
+        """
+        Answer `question` against the session's documents with the usual
+        document → Wikipedia → model fallbacks. Returns (answer, branch).
+        on_token(text_so_far) is called on the event loop as tokens arrive.
+        A question close enough to one already answered on the same
+        documents gets that answer (and its branch) from the answer cache.
+        """
+        wiki_note = MODES[mode][1]
+        with start_trace("question", mode=mode) as trace:
+            query_emb = None
+            if self.answers is not None:
+                # embedding the query is CPU work; keep it off the event loop
+                hit, scope, query_emb = await asyncio.to_thread(self._cached_answer, session_id, question, mode)
+                if hit is not None:
+                    answer, branch = hit
+                    annotate(branch=branch, cached=True)
+                    if on_token is not None:
+                        on_token(answer)
+            if self.answers is None or hit is None:
+                doc_prompt = await asyncio.to_thread(self.doc_prompt, session_id, question, mode, query_emb)
+                report = {}
+                answer, branch = await answer_question(
+                    question, self.ask_stream, self.wiki,
+                    doc_prompt=doc_prompt, wiki_note=wiki_note,
+                    speculate_model=self.speculate_model, on_token=on_token, report=report,
+                )
+                if self._cacheable(answer, report):
+                    self.answers.put(scope, query_emb, question, answer, branch)
+        if trace is not None:
+            self.session(session_id).last_trace = trace.to_dict()
+        return answer, branch
+
+    async def ask_batch(self, session_id, questions, mode="text", concurrency=None, block=BATCH_BLOCK):
+        """
+        Answer many questions against the session's documents; yields
+        (position, answer, branch, error) as each one finishes, in no
+        particular order. All questions are embedded in one encode() call,
+        retrieval runs a block at a time (one matrix product per source)
+        while earlier answers are still streaming, and at most `concurrency`
+        answers are in flight, so the LLM rate limit sets the pace. An
+        answer reached because a stage timed out comes back as an error.
+        """
+        concurrency = concurrency or self.llm.max_in_flight
+        wiki_note = MODES[mode][1]
+        embs = await asyncio.to_thread(self._encode_questions, questions)
+        scope = await asyncio.to_thread(self.answer_scope, session_id, mode) if self.answers is not None else None
+        work = asyncio.Queue(maxsize=concurrency * 2)
+        done = asyncio.Queue()
+
+        async def produce():
+            try:
+                await dispatch()
+            except Exception as exc:
+                # surfaces in the consumer instead of leaving it waiting forever
+                done.put_nowait(exc)
+
+        async def dispatch():
+            todo = []
+            for i, question in enumerate(questions):
+                hit = self.answers.get(scope, embs[i], question) if self.answers is not None else None
+                if hit is not None:
+                    done.put_nowait((i, hit[0], hit[1], None))
+                else:
+                    todo.append(i)
+            for lo in range(0, len(todo), block):
+                rows = todo[lo:lo + block]
+                prompts = await asyncio.to_thread(
+                    self.doc_prompts, session_id, [questions[i] for i in rows], embs[rows], mode,
+                )
+                for i, prompt in zip(rows, prompts):
+                    await work.put((i, prompt))
+            for _ in range(concurrency):
+                await work.put(None)
+
+        async def answer():
+            while (item := await work.get()) is not None:
+                i, prompt = item
+                try:
+                    report = {}
+                    with start_trace("question", mode=mode, batch=True):
+                        text, branch = await answer_question(
+                            questions[i], self.ask_stream, self.wiki,
+                            doc_prompt=prompt, wiki_note=wiki_note, speculate_model=self.speculate_model,
+                            report=report,
+                        )
+                    if report.get("timed_out"):
+                        # a fallback reached because a stage ran out of time (e.g. queued behind the
+                        # rate limit) is not the question's answer: report it so a resumed run retries it
+                        done.put_nowait((i, None, None, f"timed out: {', '.join(report['timed_out'])}"))
+                        continue
+                    if self._cacheable(text, report):
+                        self.answers.put(scope, embs[i], questions[i], text, branch)
+                    done.put_nowait((i, text, branch, None))
+                except Exception as exc:
+                    done.put_nowait((i, None, None, f"{type(exc).__name__}: {exc}"))
+
+        tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(answer()) for _ in range(concurrency)]
+        try:
+            for _ in range(len(questions)):
+                item = await done.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _encode_questions(self, questions):
+        with span("embed", questions=len(questions)):
+            emb = np.asarray(self.embedder().encode(list(questions), convert_to_tensor=False), dtype=np.float32)
+        return emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+    def ask_sync(self, session_id, question, mode="text", on_token=None):
+        """ask() for synchronous callers such as the Streamlit script."""
+        return asyncio.run(self.ask(session_id, question, mode=mode, on_token=on_token))
+
+    def _transcript_key(self, audio, profile, prompt, **extra):
+        return transcript_key(audio, model=WHISPER_MODEL_NAME, profile=profile or DEFAULT_PROFILE,
+                              prompt=prompt, vad=True, **extra)
+
+    def transcribe(self, session_id, audio, profile=None, on_segment=None):
+        """Transcribe audio bytes; on_segment(text_so_far) fires as each segment finishes."""
+        key = self._transcript_key(audio, profile, INITIAL_PROMPT)
+        texts = []
+        with start_trace("transcribe") as trace, span("whisper", audio_bytes=len(audio)) as sp:
+            cached = self.transcripts.get(key)
+            if cached is not None:
+                texts = [seg["text"] for seg in cached]
+                if on_segment is not None and texts:
+                    on_segment(" ".join(texts))
+            else:
+                for text in transcribe_segments(self.whisper(), audio, profile=profile, initial_prompt=INITIAL_PROMPT):
+                    texts.append(text)
+                    if on_segment is not None:
+                        on_segment(" ".join(texts))
+                self.transcripts.put(key, [{"text": t} for t in texts])
+            sp.set(segments=len(texts), cached=cached is not None)
+        if trace is not None:
+            self.session(session_id).last_trace = trace.to_dict()
+        return " ".join(texts).strip()
+
+    def transcribe_long(self, session_id, audio, profile=None, on_piece=None):
+        """
+        Transcribe a long recording (meeting, lecture) in parallel pieces cut
+        at pauses. Returns [{"start", "end", "text"}] in order, seconds from
+        the start; on_piece(done, total) reports progress.
+        """
+        # no voice-command prompt here: it would bias a meeting or lecture transcript
+        prompt = None
+        key = self._transcript_key(audio, profile, prompt, long=True)
+        with start_trace("transcribe", long=True) as trace, span("whisper", audio_bytes=len(audio)) as sp:
+            segments = self.transcripts.get(key)
+            sp.set(cached=segments is not None)
+            if segments is None:
+                segments = transcribe_long(self.whisper(), audio, profile=profile, initial_prompt=prompt,
+                                           on_piece=on_piece)
+                self.transcripts.put(key, segments)
+            sp.set(segments=len(segments))
+        if trace is not None:
+            self.session(session_id).last_trace = trace.to_dict()
+        return segments
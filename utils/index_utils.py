@@ -0,0 +1,262 @@
+import os
+
+import numpy as np
+
+# rows scored per block, so float16/int8 storage never upcasts the whole matrix
+BLOCK_ROWS = 8192
+# below this many chunks "auto" stays exact; k-means would cost more than it saves
+AUTO_IVF_MIN_ROWS = 20000
+
+
+def grow(buffer, used, rows):
+    """
+    Append `rows` after the first `used` rows of `buffer`, doubling its
+    capacity when full; returns the (possibly new) buffer. Appending N rows
+    a batch at a time copies O(N) rows in total, not O(N^2).
+    """
+    rows = np.asarray(rows, dtype=buffer.dtype)
+    need = used + len(rows)
+    if need > len(buffer):
+        bigger = np.empty((max(need, 2 * len(buffer), 16),) + buffer.shape[1:], dtype=buffer.dtype)
+        bigger[:used] = buffer[:used]
+        buffer = bigger
+    buffer[used:need] = rows
+    return buffer
+
+
+def top_k(scores, k, ids=None):
+    """
+    Indices of the k best scores, best first, in O(N + k log k).
+    Ties are broken by higher index first, the same order that
+    np.argsort(scores)[::-1] gives, so results match the old exact path.
+    """
+    if ids is None:
+        ids = np.arange(len(scores))
+    k = min(k, len(scores))
+    if k <= 0:
+        return ids[:0], scores[:0]
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= kth
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((-ids, -scores))[:k]
+    return ids[order], scores[order]
+
+
+class VectorStore:
+    """Row-major vectors kept as float32, float16 or int8 (+ one float32 scale per row)."""
+
+    def __init__(self, embeddings, storage="float32"):
+        emb = np.asarray(embeddings)
+        if emb.ndim != 2:
+            emb = emb.reshape(len(emb), -1)
+        self.storage = storage
+        self.scale = None
+        if storage == "int8":
+            emb = emb.astype(np.float32, copy=False)
+            scale = np.abs(emb).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.data = np.round(emb / scale[:, None]).astype(np.int8)
+            self.scale = scale.astype(np.float32)
+        else:
+            # no copy when the corpus already holds this dtype
+            self.data = emb.astype(storage, copy=False)
+        self._buffer = self._scale_buffer = None
+
+    def append(self, embeddings):
+        """Add rows at the end (in place, amortised; existing rows are not re-quantised)."""
+        extra = VectorStore(embeddings, self.storage)
+        if self._buffer is None:
+            # first append: copy once into a growable buffer (the rows may be a view of the corpus)
+            self._buffer = self.data.copy()
+            self._scale_buffer = self.scale.copy() if self.scale is not None else None
+        n = len(self.data)
+        self._buffer = grow(self._buffer, n, extra.data)
+        if self.scale is not None:
+            self._scale_buffer = grow(self._scale_buffer, n, extra.scale)
+            self.scale = self._scale_buffer[:n + len(extra)]
+        self.data = self._buffer[:n + len(extra)]
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def scores(self, query, rows=None):
+        query = np.asarray(query, dtype=np.float32)
+        data = self.data if rows is None else self.data[rows]
+        if self.data.dtype == np.float32:
+            out = data @ query
+        else:
+            out = np.empty(len(data), dtype=np.float32)
+            for i in range(0, len(data), BLOCK_ROWS):
+                out[i:i + BLOCK_ROWS] = data[i:i + BLOCK_ROWS].astype(np.float32) @ query
+        if self.scale is not None:
+            out *= self.scale if rows is None else self.scale[rows]
+        return out
+
+    def scores_many(self, queries):
+        """(len(queries), N) scores for a block of queries: one matrix product per row block."""
+        queries = np.asarray(queries, dtype=np.float32)
+        out = np.empty((len(queries), len(self.data)), dtype=np.float32)
+        for i in range(0, len(self.data), BLOCK_ROWS):
+            out[:, i:i + BLOCK_ROWS] = queries @ self.data[i:i + BLOCK_ROWS].astype(np.float32, copy=False).T
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+
+class ExactIndex:
+    """Brute-force inner product over every row; exact, O(N) per query."""
+
+    kind = "exact"
+
+    def __init__(self, embeddings, storage="float32"):
+        self.vectors = VectorStore(embeddings, storage)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def append(self, embeddings):
+        self.vectors.append(embeddings)
+
+    def search(self, query, k, weights=None):
+        scores = self.vectors.scores(query)
+        if weights is not None:
+            scores = scores * weights
+        return top_k(scores, k)
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: spherical k-means splits the rows into n_lists
+    cells and a query only scores the n_probe closest cells.
+    n_probe is the recall/latency knob; n_probe >= n_lists is exact.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, embeddings, storage="float16", n_lists=None, n_probe=8,
+                 iterations=10, seed=0):
+        super().__init__(embeddings, storage)
+        n = len(self.vectors)
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        self.n_probe = n_probe
+        self._train(np.asarray(embeddings, dtype=np.float32), iterations, seed)
+
+    def _assign(self, x):
+        out = np.empty(len(x), dtype=np.int64)
+        for i in range(0, len(x), BLOCK_ROWS):
+            out[i:i + BLOCK_ROWS] = np.argmax(x[i:i + BLOCK_ROWS] @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, x, iterations, seed):
+        rng = np.random.default_rng(seed)
+        # train on a sample; 256 points per cell is plenty for k-means
+        sample = x
+        if len(x) > 256 * self.n_lists:
+            sample = x[rng.choice(len(x), 256 * self.n_lists, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.n_lists) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            self.centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        assign = self._assign(x)
+        self.list_ids = np.argsort(assign, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.n_lists))])
+
+    def append(self, embeddings):
+        # ExactIndex.append would add rows that no cell lists, so search() could never return them
+        raise TypeError("an IVF index cannot grow: its cells are trained on the rows it was built with; "
+                        "build a new one over all rows with build_index(embeddings, kind=\"ivf\")")
+
+    def search(self, query, k, weights=None, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        query = np.asarray(query, dtype=np.float32)
+        cells, _ = top_k(self.centroids @ query, n_probe)
+        cand = [self.list_ids[self.offsets[c]:self.offsets[c + 1]] for c in cells]
+        if weights is not None:
+            # boosted rows are always candidates, wherever they were clustered
+            cand.append(np.flatnonzero(weights > 1))
+        cand = np.unique(np.concatenate(cand))
+        scores = self.vectors.scores(query, cand)
+        if weights is not None:
+            scores = scores * weights[cand]
+        return top_k(scores, k, ids=cand)
+
+
+class ShardedIndex:
+    """
+    Several indexes over consecutive row ranges searched as one, e.g. one
+    per memory-mapped shard of a library collection. Row ids are global;
+    results match one index over the concatenated rows.
+    """
+
+    kind = "sharded"
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.offsets = np.cumsum([0] + [len(p) for p in self.parts])
+        self.vectors = _ShardedVectors(self)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def search(self, query, k, weights=None):
+        ids, scores = [], []
+        for part, lo, hi in zip(self.parts, self.offsets[:-1], self.offsets[1:]):
+            i, s = part.search(query, k, weights=None if weights is None else weights[lo:hi])
+            ids.append(i + lo)
+            scores.append(s)
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return top_k(np.concatenate(scores), k, ids=np.concatenate(ids))
+
+
+class _ShardedVectors:
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def nbytes(self):
+        return sum(p.vectors.nbytes for p in self.index.parts)
+
+    def scores_many(self, queries):
+        return np.concatenate([p.vectors.scores_many(queries) for p in self.index.parts], axis=1)
+
+    def scores(self, query, rows=None):
+        parts, offsets = self.index.parts, self.index.offsets
+        if rows is None:
+            return np.concatenate([p.vectors.scores(query) for p in parts])
+        rows = np.asarray(rows)
+        out = np.empty(len(rows), dtype=np.float32)
+        shard = np.searchsorted(offsets, rows, side="right") - 1
+        for s in np.unique(shard):
+            mask = shard == s
+            out[mask] = parts[s].vectors.scores(query, rows[mask] - offsets[s])
+        return out
+
+
+def build_index(embeddings, kind=None, storage=None, **kwargs):
+    """
+    kind: "exact", "ivf" or "auto" (INTELEXI_INDEX, default "exact").
+    storage: "float32", "float16" or "int8" (INTELEXI_INDEX_STORAGE, default "float16").
+    """
+    kind = kind or os.getenv("INTELEXI_INDEX", "exact")
+    storage = storage or os.getenv("INTELEXI_INDEX_STORAGE", "float16")
+    if kind == "auto":
+        kind = "ivf" if len(embeddings) >= AUTO_IVF_MIN_ROWS else "exact"
+    if kind == "ivf":
+        if "n_probe" not in kwargs and os.getenv("INTELEXI_IVF_PROBE"):
+            kwargs["n_probe"] = int(os.getenv("INTELEXI_IVF_PROBE"))
+        return IVFIndex(embeddings, storage=storage, **kwargs)
+    return ExactIndex(embeddings, storage=storage)
@@ -0,0 +1,301 @@
+import contextlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from utils.index_utils import ShardedIndex, build_index
+from utils.retrieval_utils import HybridRetriever, chunk_features
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+DEFAULT_LIBRARY_PATH = os.getenv("INTELEXI_LIBRARY", os.path.join("cache", "library"))
+# granting this user gives every user access
+PUBLIC = "*"
+READ, WRITE, OWNER = "read", "write", "owner"
+_RANK = {READ: 1, WRITE: 2, OWNER: 3}
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9 _.-]{0,63}$")
+
+
+class AccessDenied(PermissionError):
+    pass
+
+
+class UnknownCollection(KeyError):
+    pass
+
+
+class InvalidRequest(ValueError):
+    """Bad input from the caller (name, role, embedding size); the service answers 400."""
+
+
+class Collection:
+    """
+    A read-only snapshot of one library collection, shared by every session
+    of the process. Embeddings stay in their memory-mapped .npy shards (the
+    OS page cache shares them between processes too); chunk text is fetched
+    from SQLite only for the chunks a question actually retrieves.
+    """
+
+    def __init__(self, library, name, shards, features, version):
+        self.library = library
+        self.name = name
+        self.shards = shards
+        self.features = features
+        self.version = version
+        self._retriever = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(s) for s in self.shards)
+
+    def retriever(self):
+        # built once per snapshot; storage follows INTELEXI_INDEX_STORAGE, and
+        # when it matches the shard dtype the arrays are used in place, not copied
+        with self._lock:
+            if self._retriever is None and len(self):
+                index = ShardedIndex([build_index(s) for s in self.shards])
+                self._retriever = HybridRetriever(index, self.features)
+            return self._retriever
+
+    def texts(self, rows):
+        return self.library.chunk_texts(self.name, rows)
+
+
+class DocumentLibrary:
+    """
+    Named, persistent document collections shared by all users of a server.
+
+    Layout under <root>/:
+        catalog.sqlite        collections, per-user access, documents, chunk text (zlib)
+        <collection>/shard_00000.npy ...   embeddings, one immutable shard per add
+    Collections only grow: adding documents appends a shard, so open
+    snapshots stay valid and the next open() picks up the new rows.
+    Users are plain ids supplied by the caller (there is no login here);
+    roles are read < write < owner, and PUBLIC grants to everyone.
+    """
+
+    def __init__(self, root=DEFAULT_LIBRARY_PATH, dtype="float16"):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        os.makedirs(root, exist_ok=True)
+        # guards the shared SQLite connection and the open snapshots; held only
+        # for catalog statements, never for shard I/O
+        self._lock = threading.RLock()
+        # one writer per process (the file lock covers other processes)
+        self._writer = threading.Lock()
+        self._open = {}
+        self._db = sqlite3.connect(os.path.join(root, "catalog.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            "name TEXT PRIMARY KEY, owner TEXT, dir TEXT, dim INTEGER, rows INTEGER, shards INTEGER, created REAL);"
+            "CREATE TABLE IF NOT EXISTS acl ("
+            "collection TEXT, user TEXT, role TEXT, PRIMARY KEY (collection, user)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection TEXT, fingerprint TEXT, name TEXT, start INTEGER, stop INTEGER, "
+            "PRIMARY KEY (collection, fingerprint)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "collection TEXT, row INTEGER, text BLOB, PRIMARY KEY (collection, row)) WITHOUT ROWID;"
+        )
+        self._db.commit()
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        # one writer at a time, across threads and processes; readers are not blocked
+        with self._writer, open(os.path.join(self.root, ".lock"), "a") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _row(self, name):
+        return self._db.execute(
+            "SELECT owner, dir, dim, rows, shards FROM collections WHERE name = ?", (name,)
+        ).fetchone()
+
+    # ---- access
+    def role(self, name, user):
+        """The user's role on a collection (own grant or PUBLIC's, whichever is higher), or None."""
+        with self._lock:
+            roles = [r for (r,) in self._db.execute(
+                "SELECT role FROM acl WHERE collection = ? AND user IN (?, ?)", (name, user, PUBLIC)
+            )]
+        return max(roles, key=_RANK.get) if roles else None
+
+    def _require(self, name, user, needed):
+        role = self.role(name, user)
+        if role is None or _RANK[role] < _RANK[needed]:
+            raise AccessDenied(f"{user} needs {needed} access to collection {name!r}")
+
+    def grant(self, name, by, user, role=READ):
+        self._require(name, by, OWNER)
+        if role not in _RANK:
+            raise InvalidRequest(f"unknown role {role!r}")
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO acl VALUES (?, ?, ?)", (name, user, role))
+            self._db.commit()
+
+    def revoke(self, name, by, user):
+        self._require(name, by, OWNER)
+        with self._lock:
+            self._db.execute("DELETE FROM acl WHERE collection = ? AND user = ? AND role != ?",
+                             (name, user, OWNER))
+            self._db.commit()
+
+    def collections(self, user):
+        """Collections `user` can read: [{"name", "owner", "role", "documents", "chunks"}]."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.name, c.owner, a.role, c.rows, "
+                "(SELECT COUNT(*) FROM documents d WHERE d.collection = c.name) "
+                "FROM collections c JOIN acl a ON a.collection = c.name "
+                "WHERE a.user IN (?, ?) ORDER BY c.name", (user, PUBLIC)
+            ).fetchall()
+        out = {}
+        for name, owner, role, n_rows, n_docs in rows:
+            if name not in out or _RANK[role] > _RANK[out[name]["role"]]:
+                out[name] = {"name": name, "owner": owner, "role": role,
+                             "documents": n_docs, "chunks": n_rows}
+        return list(out.values())
+
+    # ---- writes
+    def create(self, name, owner):
+        if not _NAME.match(name):
+            raise InvalidRequest(f"bad collection name {name!r}")
+        with self._write_lock():
+            if self.exists(name):
+                raise InvalidRequest(f"collection {name!r} already exists")
+            directory = re.sub(r"[^A-Za-z0-9_.-]+", "_", name) + f"-{int(time.time() * 1000):x}"
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+            with self._lock:
+                self._db.execute("INSERT INTO collections VALUES (?, ?, ?, NULL, 0, 0, ?)",
+                                 (name, owner, directory, time.time()))
+                self._db.execute("INSERT INTO acl VALUES (?, ?, ?)", (name, owner, OWNER))
+                self._db.commit()
+
+    def exists(self, name):
+        with self._lock:
+            return self._row(name) is not None
+
+    def known(self, name, fingerprints):
+        """The subset of `fingerprints` already in the collection (to skip re-embedding)."""
+        with self._lock:
+            return {fp for fp in fingerprints if self._db.execute(
+                "SELECT 1 FROM documents WHERE collection = ? AND fingerprint = ?", (name, fp)
+            ).fetchone()}
+
+    def add_documents(self, name, user, docs):
+        """
+        docs: [(fingerprint, file name, chunks, embeddings)]. Documents the
+        collection already holds are skipped. All new rows land in one new
+        shard, written to a temp file and renamed, then committed to the
+        catalog, so readers never see half a shard. Returns documents added.
+        """
+        self._require(name, user, WRITE)
+        with self._write_lock():
+            with self._lock:
+                _, directory, dim, rows, shards = self._row(name)
+            have = self.known(name, [d[0] for d in docs])
+            new = [d for d in docs if d[0] not in have and len(d[2])]
+            if not new:
+                return 0
+            emb = np.concatenate([np.asarray(d[3], dtype=np.float32) for d in new]).astype(self.dtype)
+            if dim is not None and emb.shape[1] != dim:
+                raise InvalidRequest(f"collection {name!r} holds {dim}-d embeddings, got {emb.shape[1]}")
+            path = os.path.join(self.root, directory, f"shard_{shards:05d}.npy")
+            np.save(path + ".tmp.npy", emb)
+            os.replace(path + ".tmp.npy", path)
+
+            with self._lock:
+                start = rows
+                for fp, file_name, chunks, _ in new:
+                    self._db.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?)",
+                                     (name, fp, file_name, start, start + len(chunks)))
+                    self._db.executemany(
+                        "INSERT INTO chunks VALUES (?, ?, ?)",
+                        [(name, start + i, zlib.compress(c.encode("utf-8"))) for i, c in enumerate(chunks)],
+                    )
+                    start += len(chunks)
+                self._db.execute("UPDATE collections SET dim = ?, rows = ?, shards = ? WHERE name = ?",
+                                 (emb.shape[1], start, shards + 1, name))
+                self._db.commit()
+        return len(new)
+
+    def delete(self, name, user):
+        self._require(name, user, OWNER)
+        with self._write_lock(), self._lock:
+            row = self._row(name)
+            for table in ("chunks", "documents", "acl"):
+                self._db.execute(f"DELETE FROM {table} WHERE collection = ?", (name,))
+            self._db.execute("DELETE FROM collections WHERE name = ?", (name,))
+            self._db.commit()
+            self._open.pop(name, None)
+        # processes that still map the shards keep reading them until they reopen
+        shutil.rmtree(os.path.join(self.root, row[1]), ignore_errors=True)
+
+    # ---- reads
+    def chunk_texts(self, name, rows):
+        rows = [int(r) for r in rows]
+        if not rows:
+            return []
+        with self._lock:
+            found = dict(self._db.execute(
+                f"SELECT row, text FROM chunks WHERE collection = ? AND row IN ({','.join('?' * len(rows))})",
+                (name, *rows),
+            ))
+        return [zlib.decompress(found[r]).decode("utf-8") for r in rows]
+
+    def open(self, name, user):
+        """
+        The collection's current snapshot; cheap when nothing changed since
+        the last open. A new one is built (shards mapped, chunk text turned
+        into features) without holding the library lock, which only guards
+        the catalog reads and publishing the result.
+        """
+        with self._lock:
+            row = self._row(name)
+        if row is None:
+            raise UnknownCollection(name)
+        self._require(name, user, READ)
+        _, directory, _, n_rows, n_shards = row
+        version = (directory, n_shards)
+        with self._lock:
+            current = self._open.get(name)
+        if current is not None and current.version == version:
+            return current
+        # append-only: keep the shards and features we already have
+        same = current is not None and current.version[0] == directory
+        shards = list(current.shards) if same else []
+        features = list(current.features) if same else []
+        with self._lock:
+            texts = self._db.execute(
+                "SELECT text FROM chunks WHERE collection = ? AND row >= ? AND row < ? ORDER BY row",
+                (name, len(features), n_rows),
+            ).fetchall()
+        for i in range(len(shards), n_shards):
+            shards.append(np.load(os.path.join(self.root, directory, f"shard_{i:05d}.npy"), mmap_mode="r"))
+        features.extend(chunk_features(zlib.decompress(text).decode("utf-8")) for (text,) in texts)
+        collection = Collection(self, name, shards, features, version)
+        with self._lock:
+            # another open() may have published the same or a newer snapshot meanwhile,
+            # or the collection was deleted; only a newer version replaces what is there
+            latest = self._open.get(name)
+            row = self._row(name)
+            if row is None or row[1] != directory:
+                return collection
+            if latest is not None and latest.version[0] == directory and latest.version[1] >= n_shards:
+                return latest
+            self._open[name] = collection
+        return collection
@@ -0,0 +1,336 @@
+import os
+import random
+import re
+import threading
+import time
+
+from utils.context_utils import CONTEXT_TOKENS, RESERVED_TOKENS
+from utils.llm_utils import ask_model, ask_model_stream
+from utils.text_utils import count_tokens
+
+# requests to the provider in flight at once, across all sessions
+MAX_IN_FLIGHT = int(os.getenv("INTELEXI_LLM_MAX_IN_FLIGHT", "8"))
+# client-side limits; the provider's x-ratelimit-* headers tighten them further
+REQUESTS_PER_MINUTE = float(os.getenv("INTELEXI_LLM_RPM", "30"))
+TOKENS_PER_MINUTE = float(os.getenv("INTELEXI_LLM_TPM", "6000"))
+# completion cap sent with every call; charged up front like the provider does, the unused part refunded
+MAX_TOKENS = int(os.getenv("INTELEXI_LLM_MAX_TOKENS", "1024"))
+# the biggest prompt we send: retrieved context plus instructions and question
+MAX_PROMPT_TOKENS = CONTEXT_TOKENS + RESERVED_TOKENS
+RETRIES = int(os.getenv("INTELEXI_LLM_RETRIES", "3"))
+# seconds for one call, including waiting for a slot, retries and the fallback
+DEADLINE = float(os.getenv("INTELEXI_LLM_DEADLINE", "60"))
+FALLBACK_MODEL = os.getenv("INTELEXI_LLM_FALLBACK_MODEL", "llama-3.3-70b-versatile")
+# e.g. a local OpenAI-compatible server for testing
+BASE_URL = os.getenv("INTELEXI_LLM_BASE_URL") or None
+CONNECT_TIMEOUT = 5.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+_DURATION = re.compile(r"([\d.]+)(ms|h|m|s)")
+# Groq error codes for a model that is gone for us; worth retrying on the fallback
+_MODEL_GONE = {"model_not_found", "model_decommissioned"}
+
+
+class DeadlineExceeded(Exception):
+    # not a TimeoutError: on Python 3.11+ that is asyncio.TimeoutError, and a gateway
+    # deadline must not be mistaken for a stage running out of time
+    pass
+
+
+def make_client(api_key, base_url=BASE_URL, max_connections=MAX_IN_FLIGHT):
+    """
+    One Groq client per process: a pooled keep-alive HTTP client, explicit
+    timeouts, and no SDK retries (the gateway does its own).
+    """
+    import httpx
+    from groq import Groq
+
+    http = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(DEADLINE, connect=CONNECT_TIMEOUT),
+    )
+    return Groq(api_key=api_key, base_url=base_url, http_client=http, max_retries=0)
+
+
+def parse_duration(text):
+    """Groq's reset headers: "2m59.56s", "7.66s", "120ms"; plain numbers are seconds."""
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION.findall(text)
+    return sum(float(v) * units[u] for v, u in parts) if parts else None
+
+
+class TokenBucket:
+    """
+    `rate` units per second, bursts up to `capacity`. take() blocks until
+    the units are there or the deadline would pass; a take bigger than the
+    capacity waits for a full bucket and leaves it in debt, so it is still
+    charged in full. It returns False, taking nothing, once `cancel` (an
+    Event) is set. give() returns units reserved but not used.
+    pause_until() empties the bucket until a time the provider told us
+    (Retry-After, reset headers).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n=1, deadline=None, cancel=None):
+        need = min(n, self.capacity)
+        while True:
+            if cancel is not None and cancel.is_set():
+                return False
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self.paused_until - now, 0)
+                if wait == 0 and self.level >= need:
+                    self.level -= n
+                    return True
+                wait = max(wait, (need - self.level) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("rate limit wait would pass the deadline")
+            if cancel is not None:
+                cancel.wait(min(wait, 1.0))
+            else:
+                time.sleep(min(wait, 1.0))
+
+    def give(self, n):
+        with self._lock:
+            self.level = min(self.capacity, self.level + n)
+
+    def pause_until(self, until):
+        with self._lock:
+            self.paused_until = max(self.paused_until, until)
+            self.level = 0.0
+
+
+def _transient(exc):
+    import groq
+
+    if isinstance(exc, (groq.APITimeoutError, groq.APIConnectionError)):
+        return True
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def _model_unavailable(exc):
+    # worth trying the other model: it does not exist / was retired for us
+    body = getattr(exc, "body", None)
+    error = body.get("error", body) if isinstance(body, dict) else None
+    return isinstance(error, dict) and error.get("code") in _MODEL_GONE
+
+
+class LLMGateway:
+    """
+    Every LLM call of the process goes through here:
+      - at most `max_in_flight` requests at once (the rest wait for a slot),
+      - request and token buckets sized to the provider's per-minute limits
+        and re-synced from its x-ratelimit-* / Retry-After headers; a call
+        is charged its prompt plus `max_tokens` up front and refunded the
+        part of the completion it did not use,
+      - jittered exponential retries on 429, 5xx, timeouts and dropped
+        connections; a stream is only retried before its first token,
+      - one deadline per call covering all of that,
+      - then the same prompt on `fallback_model` with whatever time is left.
+    """
+
+    def __init__(self, client, model, fallback_model=FALLBACK_MODEL, max_in_flight=MAX_IN_FLIGHT,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 retries=RETRIES, deadline=DEADLINE, max_tokens=MAX_TOKENS):
+        # a client, or a zero-arg factory called on first use (keeps groq/httpx off the import path)
+        self._client_or_factory = client
+        self._client_lock = threading.Lock()
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.retries = retries
+        self.deadline = deadline
+        self.max_in_flight = max_in_flight
+        self.max_tokens = max_tokens
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 6))
+        # room for the biggest single call, so it is never capped below its real cost
+        self._tokens = TokenBucket(tokens_per_minute / 60,
+                                   max(1.0, tokens_per_minute / 6, MAX_PROMPT_TOKENS + max_tokens))
+        self._stats_lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "fallbacks": 0, "failures": 0, "rate_limited": 0}
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if callable(self._client_or_factory):
+                self._client_or_factory = self._client_or_factory()
+            return self._client_or_factory
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.counters[key] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counters)
+
+    # ---- provider feedback
+    def _on_headers(self, headers):
+        now = time.monotonic()
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self._requests.pause_until(now + reset)
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and remaining_tokens.isdigit():
+            with self._tokens._lock:
+                self._tokens.level = min(self._tokens.level, float(remaining_tokens))
+
+    def _on_error(self, exc):
+        response = getattr(exc, "response", None)
+        if response is None or getattr(exc, "status_code", None) != 429:
+            return None
+        self._count("rate_limited")
+        retry_after = parse_duration(response.headers.get("retry-after"))
+        if retry_after:
+            self._requests.pause_until(time.monotonic() + retry_after)
+        return retry_after
+
+    # ---- calls
+    def _admit(self, prompt, deadline, cancel=None):
+        # False: `cancel` was set while waiting; nothing was sent and nothing stays charged
+        if not self._requests.take(1, deadline, cancel):
+            return False
+        cost = count_tokens(prompt) + self.max_tokens
+        if not self._tokens.take(cost, deadline, cancel):
+            self._requests.give(1)
+            return False
+        while not self._slots.acquire(timeout=min(max(deadline - time.monotonic(), 0), 1.0)):
+            if cancel is not None and cancel.is_set():
+                self._requests.give(1)
+                self._tokens.give(cost)
+                return False
+            if time.monotonic() >= deadline:
+                self._settle("")
+                raise DeadlineExceeded("no free LLM slot before the deadline")
+        return True
+
+    def _settle(self, completion):
+        # the prompt stays charged (the provider counts it even for failed calls); the unused completion cap comes back
+        self._tokens.give(max(self.max_tokens - count_tokens(completion), 0))
+
+    def _backoff(self, attempt, deadline, floor=None):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        delay = max(delay, floor or 0)
+        if time.monotonic() + delay > deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _client(self, deadline):
+        # the HTTP timeout never outlives the call's deadline
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded("LLM call ran out of time")
+        with_options = getattr(self.client, "with_options", None)
+        return with_options(timeout=left) if with_options else self.client
+
+    def _models(self, model):
+        models = [model or self.model]
+        if self.fallback_model and self.fallback_model not in models:
+            models.append(self.fallback_model)
+        return models
+
+    def ask(self, prompt, model=None, deadline=None):
+        """ask_model() with the limits, retries, deadline and fallback above."""
+        deadline = time.monotonic() + (deadline or self.deadline)
+        self._count("calls")
+        last = None
+        for i, name in enumerate(self._models(model)):
+            if i:
+                self._count("fallbacks")
+            for attempt in range(self.retries + 1):
+                self._admit(prompt, deadline)
+                try:
+                    answer = ask_model(self._client(deadline), name, prompt, on_headers=self._on_headers,
+                                       max_tokens=self.max_tokens)
+                    self._settle(answer or "")
+                    return answer
+                except Exception as exc:
+                    self._settle("")
+                    last = exc
+                    floor = self._on_error(exc)
+                    if _model_unavailable(exc) or not _transient(exc):
+                        break
+                finally:
+                    self._slots.release()
+                if attempt == self.retries or not self._backoff(attempt, deadline, floor):
+                    break
+                self._count("retries")
+            if last is not None and not (_transient(last) or _model_unavailable(last)):
+                break
+        self._count("failures")
+        raise last
+
+    def stream(self, prompt, cancel=None, model=None, deadline=None):
+        """
+        ask_model_stream() through the gateway. Failures before the first
+        token are retried / fall back; after it they are raised (the caller
+        has already shown part of the answer). The slot is held until the
+        stream ends and the deadline also bounds the whole stream. If
+        `cancel` is set while the call waits for admission, it ends without
+        sending anything.
+        """
+        deadline = time.monotonic() + (deadline or self.deadline)
+        self._count("calls")
+        last = None
+        for i, name in enumerate(self._models(model)):
+            if i:
+                self._count("fallbacks")
+            for attempt in range(self.retries + 1):
+                if not self._admit(prompt, deadline, cancel):
+                    return
+                try:
+                    tokens = ask_model_stream(self._client(deadline), name, prompt, cancel=cancel,
+                                              on_headers=self._on_headers, max_tokens=self.max_tokens)
+                    first = next(tokens, None)
+                except Exception as exc:
+                    self._slots.release()
+                    self._settle("")
+                    last = exc
+                    floor = self._on_error(exc)
+                    if _model_unavailable(exc) or not _transient(exc):
+                        break
+                    if attempt == self.retries or not self._backoff(attempt, deadline, floor):
+                        break
+                    self._count("retries")
+                    continue
+                parts = [first or ""]
+                try:
+                    if first is not None:
+                        yield first
+                    for token in tokens:
+                        if time.monotonic() > deadline:
+                            raise DeadlineExceeded("LLM stream ran past its deadline")
+                        parts.append(token)
+                        yield token
+                finally:
+                    tokens.close()
+                    self._slots.release()
+                    self._settle("".join(parts))
+                return
+            if last is not None and not (_transient(last) or _model_unavailable(last)):
+                break
+        self._count("failures")
+        raise last
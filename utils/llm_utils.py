@@ -0,0 +1,42 @@
+def ask_model(client, model_name, prompt, on_headers=None, max_tokens=None):
+    kwargs = dict(model=model_name, messages=[{"role": "user", "content": prompt}])
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    if on_headers is None:
+        response = client.chat.completions.create(**kwargs)
+    else:
+        raw = client.chat.completions.with_raw_response.create(**kwargs)
+        on_headers(raw.headers)
+        response = raw.parse()
+    return response.choices[0].message.content
+
+
+def ask_model_stream(client, model_name, prompt, cancel=None, on_headers=None, max_tokens=None):
+    """
+    Yield the answer piece by piece as the API emits it.
+    Stops early when `cancel` (a threading.Event) is set or the consumer
+    closes the generator; the HTTP stream is closed either way.
+    on_headers(headers) sees the response headers (rate-limit state).
+    """
+    kwargs = dict(model=model_name, messages=[{"role": "user", "content": prompt}], stream=True)
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    if on_headers is None:
+        stream = client.chat.completions.create(**kwargs)
+    else:
+        raw = client.chat.completions.with_raw_response.create(**kwargs)
+        on_headers(raw.headers)
+        stream = raw.parse()
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
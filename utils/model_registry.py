@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import types
+
+
+def _rss_bytes():
+    # resident set size from /proc (Linux); None elsewhere
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class SharedModel:
+    """
+    Read-only handle on a registry model. Method calls are counted and,
+    when `serialize` is set, run one at a time under the model's lock.
+    A call that returns a generator (faster-whisper decodes lazily, as
+    `segments, info = transcribe(...)`) stays in use until the generator
+    is exhausted or closed.
+    """
+
+    def __init__(self, name, model, serialize):
+        self.name = name
+        self.model = model
+        self.serialize = serialize
+        self.lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+        self.in_use = 0
+        self.rss_delta = None
+
+    def __getattr__(self, attr):
+        value = getattr(self.model, attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            self._acquire()
+            try:
+                if self.serialize:
+                    with self.lock:
+                        result = value(*args, **kwargs)
+                else:
+                    result = value(*args, **kwargs)
+                return self._hold(result)
+            finally:
+                self._release()
+
+        return call
+
+    def _acquire(self):
+        with self._stats_lock:
+            self.uses += 1
+            self.in_use += 1
+
+    def _release(self):
+        with self._stats_lock:
+            self.in_use -= 1
+            self.last_used = time.time()
+
+    def _hold(self, result):
+        if isinstance(result, types.GeneratorType):
+            return self._held(result)
+        if isinstance(result, tuple) and any(isinstance(r, types.GeneratorType) for r in result):
+            return tuple(self._held(r) if isinstance(r, types.GeneratorType) else r for r in result)
+        return result
+
+    def _held(self, gen):
+        with self._stats_lock:
+            self.in_use += 1
+        return _Held(gen, self._release)
+
+
+class _Held:
+    """A generator that keeps its model in use until it is exhausted, closed or dropped."""
+
+    def __init__(self, gen, release):
+        self._gen = gen
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._gen)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            self._gen.close()
+            release()
+
+    def __del__(self):
+        self.close()
+
+
+class ModelRegistry:
+    """
+    Process-wide model registry: each model is loaded once, on first use,
+    and shared by every session. Idle models are evicted after
+    `idle_seconds`, and at most `max_resident` models are kept loaded
+    (least recently used goes first; models mid-call, including ones whose
+    lazy results are still being consumed, are never evicted).
+    """
+
+    def __init__(self, max_resident=None, idle_seconds=None):
+        self.max_resident = max_resident or int(os.getenv("INTELEXI_MAX_MODELS", "0")) or None
+        self.idle_seconds = idle_seconds or float(os.getenv("INTELEXI_MODEL_IDLE_SECONDS", "0")) or None
+        self._loaders = {}
+        self._models = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, serialize=True):
+        with self._lock:
+            self._loaders[name] = (loader, serialize)
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        self.evict_idle()
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        loader, serialize = self._loaders[name]
+        # one loader per model at a time; other sessions wait for it
+        with self._load_locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                before = _rss_bytes()
+                model = SharedModel(name, loader(), serialize)
+                after = _rss_bytes()
+                if before is not None and after is not None:
+                    model.rss_delta = max(after - before, 0)
+                with self._lock:
+                    self._models[name] = model
+                    self._enforce_cap(keep=name)
+        return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def evict(self, name):
+        with self._lock:
+            return self._models.pop(name, None) is not None
+
+    def evict_idle(self, idle_seconds=None):
+        idle_seconds = idle_seconds or self.idle_seconds
+        if not idle_seconds:
+            return []
+        now = time.time()
+        with self._lock:
+            idle = [n for n, m in self._models.items()
+                    if m.in_use == 0 and now - m.last_used > idle_seconds]
+            for n in idle:
+                del self._models[n]
+        return idle
+
+    def _enforce_cap(self, keep):
+        if not self.max_resident:
+            return
+        lru = sorted((m.last_used, n) for n, m in self._models.items() if n != keep and m.in_use == 0)
+        while len(self._models) > self.max_resident and lru:
+            del self._models[lru.pop(0)[1]]
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "name": n,
+                    "uses": m.uses,
+                    "in_use": m.in_use,
+                    "idle_seconds": round(time.time() - m.last_used, 1),
+                    "rss_mb": round(m.rss_delta / 2**20, 1) if m.rss_delta is not None else None,
+                }
+                for n, m in self._models.items()
+            ]
@@ -0,0 +1,226 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# page ranges handed to one worker at a time
+PAGES_PER_SHARD = 16
+# below this many pages the pool start-up costs more than it saves
+MIN_PARALLEL_PAGES = 24
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def default_workers():
+    return int(os.getenv("INTELEXI_PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _get_pool(workers):
+    # 🔥 one long-lived pool per process; "spawn" so we never fork Streamlit's threads
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _drop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def read_bytes(f):
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, "rb") as fh:
+            return fh.read()
+    if hasattr(f, "getvalue"):
+        return f.getvalue()
+    data = f.read()
+    if hasattr(f, "seek"):
+        f.seek(0)
+    return data
+
+
+def file_name(f):
+    if isinstance(f, (str, os.PathLike)):
+        return os.path.basename(f)
+    return getattr(f, "name", "unknown")
+
+
+def _open(backend, src):
+    # src is the raw bytes, or a path when the file was spilled for the pool
+    if isinstance(src, bytes):
+        src = io.BytesIO(src)
+    if backend == "pdfplumber":
+        import pdfplumber
+        return pdfplumber.open(src)
+    # "pypdf2" is optional: PyPDF2 is not in requirements.txt
+    from PyPDF2 import PdfReader
+    return PdfReader(src)
+
+
+def _close(pdf):
+    if hasattr(pdf, "close"):
+        pdf.close()
+
+
+def _page_count(backend, data):
+    pdf = _open(backend, data)
+    try:
+        return len(pdf.pages)
+    finally:
+        _close(pdf)
+
+
+def _page_text(page):
+    txt = page.extract_text()
+    # pdfplumber keeps every parsed page's layout objects until told otherwise
+    if hasattr(page, "close"):
+        page.close()
+    return txt
+
+
+def _extract_range(backend, data, start, stop):
+    pdf = _open(backend, data)
+    try:
+        out = []
+        for page in pdf.pages[start:stop]:
+            txt = _page_text(page)
+            if txt:
+                out.append(txt)
+        return out
+    finally:
+        _close(pdf)
+
+
+def iter_pages(f, backend="pdfplumber", workers=None, pages_per_shard=PAGES_PER_SHARD):
+    """
+    Yield one file's page texts in order, as they are extracted, so callers
+    can chunk and embed while the rest of the file is still being read.
+    Big files are read by the process pool with only a few shards in flight
+    at a time; only their text is held, never the whole document's.
+    Raises whatever the PDF library raises on a broken file.
+    """
+    workers = workers or default_workers()
+    data = read_bytes(f)
+    n_pages = _page_count(backend, data)
+    if workers > 1 and n_pages >= MIN_PARALLEL_PAGES:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            tmp.write(data)
+        try:
+            yield from _iter_pages_pooled(backend, tmp.name, n_pages, workers, pages_per_shard)
+        finally:
+            os.remove(tmp.name)
+        return
+    pdf = _open(backend, data)
+    try:
+        for page in pdf.pages:
+            txt = _page_text(page)
+            if txt:
+                yield txt
+    finally:
+        _close(pdf)
+
+
+def _iter_pages_pooled(backend, path, n_pages, workers, pages_per_shard):
+    ranges = [(start, min(start + pages_per_shard, n_pages)) for start in range(0, n_pages, pages_per_shard)]
+    pending = []
+    done = 0
+    try:
+        pool = _get_pool(workers)
+        # a bounded window: enough shards to keep every worker busy, no more
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_range, backend, path, start, stop))
+            if len(pending) >= workers * 2:
+                yield from pending.pop(0).result()
+                done += 1
+        while pending:
+            yield from pending.pop(0).result()
+            done += 1
+    except BrokenProcessPool:
+        _drop_pool()
+        # finish in-process from the first shard we have not yielded
+        for start, stop in ranges[done:]:
+            yield from _extract_range(backend, path, start, stop)
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def iter_documents(files, backend="pdfplumber", workers=None, pages_per_shard=PAGES_PER_SHARD):
+    """
+    Yield (file, page texts) for each file in order, where page texts is an
+    iterable like iter_pages(file). While the caller works through one file
+    the pool is already extracting the next few small ones (under
+    MIN_PARALLEL_PAGES pages, one worker each); big files are sharded by
+    iter_pages when their turn comes. Only those few files' text is held
+    ahead. A broken file raises when its pages are read.
+    """
+    workers = workers or default_workers()
+    files = list(files)
+    if workers <= 1 or len(files) < 2:
+        for f in files:
+            yield f, iter_pages(f, backend=backend, workers=workers, pages_per_shard=pages_per_shard)
+        return
+    ahead = {}
+    try:
+        for pos, f in enumerate(files):
+            for nxt in range(pos, min(pos + workers + 1, len(files))):
+                if nxt not in ahead:
+                    ahead[nxt] = _submit_whole(files[nxt], backend, workers)
+            fut = ahead.pop(pos)
+            if fut is None:
+                yield f, iter_pages(f, backend=backend, workers=workers, pages_per_shard=pages_per_shard)
+            else:
+                yield f, _whole_pages(fut, f, backend)
+    finally:
+        for fut in ahead.values():
+            if fut is not None:
+                fut.cancel()
+
+
+def _submit_whole(f, backend, workers):
+    # a small file goes to one worker in one piece; None = leave it to iter_pages
+    try:
+        data = read_bytes(f)
+        n_pages = _page_count(backend, data)
+    except Exception:
+        return None  # iter_pages raises it again when the caller gets to this file
+    if n_pages >= MIN_PARALLEL_PAGES:
+        return None
+    try:
+        return _get_pool(workers).submit(_extract_range, backend, data, 0, n_pages)
+    except BrokenProcessPool:
+        _drop_pool()
+        return None
+
+
+def _whole_pages(fut, f, backend):
+    try:
+        pages = fut.result()
+    except BrokenProcessPool:
+        _drop_pool()
+        pages = list(iter_pages(f, backend=backend, workers=1))
+    yield from pages
+
+
+def warn_failed(failed_files):
+    if failed_files:
+        import streamlit as st
+        st.warning(f"⚠️ Could not extract text from: {', '.join(failed_files)}")
+
+
+def fingerprint(f):
+    return hashlib.sha256(read_bytes(f)).hexdigest()
@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# how long a batch may wait for more queries, and how many it takes at most
+MAX_WAIT_MS = float(os.getenv("INTELEXI_QUERY_BATCH_WAIT_MS", "3"))
+MAX_BATCH = int(os.getenv("INTELEXI_QUERY_BATCH_MAX", "32"))
+
+
+class QueryBatcher:
+    """
+    Encodes questions from many threads with one forward pass per batch.
+
+    A background thread takes whatever queries are queued, encodes them
+    together and hands each caller its (normalised) vector. It only waits
+    up to `max_wait_ms` for more queries when the previous batch had company,
+    so a lone user is encoded immediately; under load the queue fills while
+    the model runs and batches grow on their own.
+    `get_model` is called per batch, so a registry may swap the model.
+    """
+
+    def __init__(self, get_model, max_wait_ms=MAX_WAIT_MS, max_batch=MAX_BATCH):
+        self.get_model = get_model
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, text, timeout=None):
+        fut = Future()
+        self._queue.put((text, fut))
+        return fut.result(timeout)
+
+    def _collect(self, crowded):
+        batch = [self._queue.get()]
+        wait_until = None
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            if not crowded or self.max_wait <= 0:
+                break
+            if wait_until is None:
+                wait_until = time.perf_counter() + self.max_wait
+            left = wait_until - time.perf_counter()
+            if left <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        crowded = False
+        while True:
+            batch = self._collect(crowded)
+            crowded = len(batch) > 1
+            live = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                emb = np.asarray(self.get_model().encode([t for t, _ in live], convert_to_tensor=False),
+                                 dtype=np.float32)
+                emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            except BaseException as exc:
+                for _, f in live:
+                    f.set_exception(exc)
+                continue
+            self.batches += 1
+            self.queries += len(live)
+            for (_, f), vec in zip(live, emb):
+                f.set_result(vec)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
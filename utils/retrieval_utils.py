@@ -0,0 +1,182 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from utils.index_utils import grow, top_k
+
+# keeps clause numbers ("4.2.1"), codes ("E-1042", "err_404") and words together
+_TERM = re.compile(r"[a-z0-9]+(?:[.\-_/][a-z0-9]+)*")
+# weight of the (max-normalised) BM25 score next to the cosine score; 0 = dense only
+LEXICAL_WEIGHT = float(os.getenv("INTELEXI_LEXICAL_WEIGHT", "0.5"))
+# candidates taken from each retriever before fusion
+CANDIDATES = 50
+
+
+def terms(text):
+    out = []
+    for t in _TERM.findall(text.lower()):
+        out.append(t)
+        # a compound also matches its parts: "4.2.1" -> "4", "2", "1"
+        if not t.isalnum():
+            out.extend(p for p in re.split(r"[.\-_/]", t) if p)
+    return out
+
+
+def chunk_features(chunk):
+    """Everything retrieval needs from a chunk, computed once at ingest."""
+    return {
+        "boost": 3.0 if "preamble" in chunk.lower() else 1.0,
+        "terms": Counter(terms(chunk)),
+    }
+
+
+class _Postings:
+    """CSR postings (term -> global chunk ids, tf) for chunks start..start+len(term_counts)."""
+
+    def __init__(self, term_counts, start):
+        self.start, self.stop = start, start + len(term_counts)
+        self.vocab = {}
+        doc_ids, term_ids, tfs = [], [], []
+        for d, counts in enumerate(term_counts, start):
+            for t, c in counts.items():
+                term_ids.append(self.vocab.setdefault(t, len(self.vocab)))
+                doc_ids.append(d)
+                tfs.append(c)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.tf = np.asarray(tfs, dtype=np.float32)[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(self.vocab)))])
+        self.weights = None
+        self.avgdl = None
+
+    def reweight(self, lengths, avgdl, k1, b):
+        # the tf part of BM25 per posting; only changes when the corpus does
+        if self.avgdl != avgdl:
+            norm = k1 * (1 - b + b * lengths[self.doc_ids] / avgdl)
+            self.weights = self.tf * (k1 + 1) / (self.tf + norm)
+            self.avgdl = avgdl
+
+    def get(self, term):
+        tid = self.vocab.get(term)
+        if tid is None:
+            return None
+        lo, hi = self.offsets[tid], self.offsets[tid + 1]
+        return self.doc_ids[lo:hi], self.weights[lo:hi]
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunks. Postings live in a few CSR segments so that
+    append() (streaming ingest) only indexes the new chunks; segments are
+    merged like a binary counter, so there are O(log N) of them and each
+    chunk is re-indexed O(log N) times in all. idf comes from the current
+    totals and the per-posting weights are refreshed after the corpus
+    changes, so scores match an index built over all chunks at once.
+    """
+
+    def __init__(self, term_counts, k1=1.5, b=0.75):
+        self.k1, self.b = k1, b
+        self.n_docs = 0
+        self._counts = []
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._segments = []
+        self.append(term_counts)
+
+    def append(self, term_counts):
+        term_counts = list(term_counts)
+        if not term_counts:
+            return
+        start = self.n_docs
+        self._counts.extend(term_counts)
+        self._lengths = grow(self._lengths, start, [sum(c.values()) for c in term_counts])
+        self.n_docs = start + len(term_counts)
+        self._segments.append(_Postings(term_counts, start))
+        while len(self._segments) > 1 and len(self._segments[-1]) >= len(self._segments[-2]):
+            last = self._segments.pop()
+            prev = self._segments.pop()
+            self._segments.append(_Postings(self._counts[prev.start:last.stop], prev.start))
+
+    def scores(self, query):
+        out = np.zeros(self.n_docs, dtype=np.float32)
+        if not self.n_docs:
+            return out
+        lengths = self._lengths[:self.n_docs]
+        avgdl = max(float(lengths.mean()), 1e-6)
+        for seg in self._segments:
+            seg.reweight(lengths, avgdl, self.k1, self.b)
+        for t in set(terms(query)):
+            found = [p for p in (seg.get(t) for seg in self._segments) if p is not None]
+            if not found:
+                continue
+            df = sum(len(ids) for ids, _ in found)
+            idf = np.float32(np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5)))
+            for ids, weights in found:
+                np.add.at(out, ids, idf * weights)
+        return out
+
+
+class HybridRetriever:
+    """
+    Dense index + BM25 + per-chunk boosts, all built at ingest.
+    Per query: dense top-CANDIDATES from the index, lexical top-CANDIDATES
+    from BM25, then one vectorised fusion over the union:
+        (cosine + lexical_weight * bm25 / max_bm25) * boost
+    With lexical_weight 0 the ranking is exactly the dense path's.
+    """
+
+    def __init__(self, index, features, lexical_weight=None):
+        self.index = index
+        self.boosts = self._boost_buffer = np.array([f["boost"] for f in features], dtype=np.float32)
+        self.lexical_weight = LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+        self.bm25 = BM25Index([f["terms"] for f in features]) if self.lexical_weight else None
+
+    def append(self, index, features):
+        """Take in chunks added at the end: `index` already holds their rows, `features` are theirs."""
+        self.index = index
+        n = len(self.boosts)
+        self._boost_buffer = grow(self._boost_buffer, n, [f["boost"] for f in features])
+        self.boosts = self._boost_buffer[:n + len(features)]
+        if self.bm25 is not None:
+            self.bm25.append(f["terms"] for f in features)
+
+    def search(self, query_emb, query_text, k):
+        m = max(k, CANDIDATES)
+        dense_ids, _ = self.index.search(query_emb, m, weights=self.boosts)
+        cand = dense_ids
+        lexical = None
+        if self.bm25 is not None:
+            lexical = self.bm25.scores(query_text)
+            lex_ids, _ = top_k(lexical, m)
+            cand = np.union1d(dense_ids, lex_ids[lexical[lex_ids] > 0])
+        scores = self.index.vectors.scores(query_emb, cand)
+        if lexical is not None and lexical.max() > 0:
+            scores = scores + self.lexical_weight * lexical[cand] / lexical.max()
+        return top_k(scores * self.boosts[cand], k, ids=cand)
+
+    def search_many(self, query_embs, query_texts, k):
+        """
+        search() for a block of queries, with the dense scores of all of
+        them from one matrix product. Dense candidates are always exact here
+        (an IVF index is not probed), so batch results can only gain recall.
+        """
+        m = max(k, CANDIDATES)
+        dense = self.index.vectors.scores_many(query_embs)
+        out = []
+        for scores, text in zip(dense, query_texts):
+            cand, _ = top_k(scores * self.boosts, m)
+            lexical = None
+            if self.bm25 is not None:
+                lexical = self.bm25.scores(text)
+                lex_ids, _ = top_k(lexical, m)
+                cand = np.union1d(cand, lex_ids[lexical[lex_ids] > 0])
+            fused = scores[cand]
+            if lexical is not None and lexical.max() > 0:
+                fused = fused + self.lexical_weight * lexical[cand] / lexical.max()
+            out.append(top_k(fused * self.boosts[cand], k, ids=cand))
+        return out
@@ -0,0 +1,111 @@
+import functools
+import os
+import re
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+# "words" = fixed 200-word windows, "sentences" = sentence-aligned with overlap
+CHUNKER = os.getenv("INTELEXI_CHUNKER", "words")
+
+
+def split_text(text, chunk_size=200):
+    words = text.split()
+    return [" ".join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
+
+
+def count_tokens(text):
+    """
+    Token count for budgets and rate limits. With INTELEXI_TOKENIZER set to
+    a tokenizer.json (e.g. the model's, from Hugging Face) and the
+    `tokenizers` package installed, this is the exact count. Otherwise it is
+    a rough estimate: one per word or punctuation mark, one more per 8
+    characters of long words, and one per 3 digits of numbers.
+    """
+    tokenizer = _tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return sum((len(t) + 2) // 3 if t.isdigit() else 1 + (len(t) - 1) // 8 for t in _TOKEN.findall(text))
+
+
+@functools.lru_cache(maxsize=1)
+def _tokenizer():
+    path = os.getenv("INTELEXI_TOKENIZER")
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+
+        return Tokenizer.from_file(path)
+    except Exception as exc:
+        print(f"[tokens] could not load INTELEXI_TOKENIZER={path!r} ({exc}); estimating instead")
+        return None
+
+
+def split_sentences(text):
+    return [s for s in _SENTENCE.split(text.strip()) if s]
+
+
+def _pack_sentences(sentences, max_tokens=256, overlap_sentences=1):
+    # whole sentences into chunks of at most `max_tokens`; each chunk repeats the last
+    # `overlap_sentences` of the previous one, and an over-long sentence falls back to word windows
+    current, size = [], 0
+    for sentence in sentences:
+        n = count_tokens(sentence)
+        if n > max_tokens:
+            if current:
+                yield " ".join(current)
+                current, size = [], 0
+            yield from split_text(sentence, chunk_size=max(1, max_tokens * 3 // 4))
+            continue
+        if current and size + n > max_tokens:
+            yield " ".join(current)
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            size = sum(count_tokens(s) for s in current)
+            if size + n > max_tokens:
+                current, size = [], 0
+        current.append(sentence)
+        size += n
+    if current:
+        yield " ".join(current)
+
+
+def _stream_words(pages, chunk_size=200):
+    words = []
+    for page in pages:
+        words.extend(page.split())
+        while len(words) >= chunk_size:
+            yield " ".join(words[:chunk_size])
+            del words[:chunk_size]
+    if words:
+        yield " ".join(words)
+
+
+def _stream_sentences(pages, max_words):
+    # the last sentence of a page may continue on the next, so it is carried over
+    carry = ""
+    for page in pages:
+        text = " ".join(page.split())
+        if not text:
+            continue
+        sentences = split_sentences(f"{carry} {text}" if carry else text)
+        carry = sentences.pop() if sentences else ""
+        yield from sentences
+        # text with no sentence ends at all (tables, lists) must not pile up
+        if carry.count(" ") >= max_words:
+            yield carry
+            carry = ""
+    if carry:
+        yield carry
+
+
+def stream_chunks(pages, chunker=None):
+    """
+    Chunks of an iterable of page texts (200-word windows, or sentences
+    packed with overlap; see CHUNKER), yielded as the pages arrive: holds
+    one chunk's worth of text at a time instead of the whole document.
+    Word windows run on across page breaks.
+    """
+    if (chunker or CHUNKER) == "sentences":
+        return _pack_sentences(_stream_sentences(pages, max_words=2048))
+    return _stream_words(pages)
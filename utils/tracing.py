@@ -0,0 +1,207 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+# INTELEXI_TRACING=0 turns every span into a shared no-op object
+ENABLED = os.getenv("INTELEXI_TRACING", "1") != "0"
+# append finished traces here as JSON lines (optional)
+TRACE_FILE = os.getenv("INTELEXI_TRACE_FILE")
+# rewrite Prometheus text here after each trace, for a textfile collector (optional)
+METRICS_FILE = os.getenv("INTELEXI_METRICS_FILE")
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_current = contextvars.ContextVar("intelexi_trace", default=None)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "start", "end")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = self.end = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+        return False
+
+    @property
+    def duration_ms(self):
+        return (self.end - self.start) * 1000
+
+
+class Trace:
+    """One user request (an upload, a question, a transcription) and its stage spans."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.spans = []
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+
+    def span(self, name, **attrs):
+        return Span(self, name, attrs)
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self):
+        return {
+            "trace": self.name,
+            "time": self.wall_start,
+            "duration_ms": round(self.duration_ms, 3),
+            **self.attrs,
+            "spans": [
+                {
+                    "name": s.name,
+                    "offset_ms": round((s.start - self.start) * 1000, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    **s.attrs,
+                }
+                for s in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+
+class Metrics:
+    """Process-wide duration histograms per (trace, stage) and answer-branch counters."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self._hist = {}
+        self._branches = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, key, ms):
+        h = self._hist.get(key)
+        if h is None:
+            h = self._hist[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, b in enumerate(self.buckets):
+            if ms <= b:
+                h[0][i] += 1
+        h[1] += ms
+        h[2] += 1
+
+    def record(self, trace):
+        with self._lock:
+            self._observe((trace.name, "total"), trace.duration_ms)
+            for s in trace.spans:
+                self._observe((trace.name, s.name), s.duration_ms)
+            branch = trace.attrs.get("branch")
+            if branch:
+                self._branches[branch] = self._branches.get(branch, 0) + 1
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP intelexi_stage_duration_ms Duration of pipeline stages in milliseconds.",
+            "# TYPE intelexi_stage_duration_ms histogram",
+        ]
+        with self._lock:
+            for (trace, stage), (counts, total, n) in sorted(self._hist.items()):
+                labels = f'trace="{trace}",stage="{stage}"'
+                for b, c in zip(self.buckets, counts):
+                    lines.append(f'intelexi_stage_duration_ms_bucket{{{labels},le="{b}"}} {c}')
+                lines.append(f'intelexi_stage_duration_ms_bucket{{{labels},le="+Inf"}} {n}')
+                lines.append(f"intelexi_stage_duration_ms_sum{{{labels}}} {total:.3f}")
+                lines.append(f"intelexi_stage_duration_ms_count{{{labels}}} {n}")
+            lines.append("# HELP intelexi_answers_total Answers by fallback branch.")
+            lines.append("# TYPE intelexi_answers_total counter")
+            for branch, n in sorted(self._branches.items()):
+                lines.append(f'intelexi_answers_total{{branch="{branch}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f"{trace}.{stage}": {"count": n, "mean_ms": round(total / n, 3)}
+                for (trace, stage), (_, total, n) in self._hist.items()
+            }
+
+
+METRICS = Metrics()
+_export_lock = threading.Lock()
+
+
+def _export(trace):
+    METRICS.record(trace)
+    if TRACE_FILE or METRICS_FILE:
+        with _export_lock:
+            if TRACE_FILE:
+                with open(TRACE_FILE, "a") as fh:
+                    fh.write(json.dumps(trace.to_dict(), default=str) + "\n")
+            if METRICS_FILE:
+                tmp = METRICS_FILE + ".tmp"
+                with open(tmp, "w") as fh:
+                    fh.write(METRICS.prometheus_text())
+                os.replace(tmp, METRICS_FILE)
+
+
+class start_trace:
+    """
+    with start_trace("question", mode="text") as trace: ...
+    Makes `trace` current for span()/annotate() in this context (asyncio
+    tasks started inside inherit it). Yields None when tracing is off.
+    """
+
+    def __init__(self, name, **attrs):
+        self.trace = Trace(name, attrs) if ENABLED else None
+        self._token = None
+
+    def __enter__(self):
+        if self.trace is not None:
+            self._token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is None:
+            return False
+        _current.reset(self._token)
+        self.trace.end = time.perf_counter()
+        if exc_type is not None:
+            self.trace.attrs["error"] = exc_type.__name__
+        _export(self.trace)
+        return False
+
+
+def span(name, **attrs):
+    trace = _current.get()
+    if trace is None:
+        return NOOP
+    return Span(trace, name, attrs)
+
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
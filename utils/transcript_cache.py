@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TRANSCRIPT_DB = os.getenv("INTELEXI_TRANSCRIPT_DB", os.path.join("cache", "transcripts.sqlite"))
+TTL_SECONDS = float(os.getenv("INTELEXI_TRANSCRIPT_TTL", str(30 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("INTELEXI_TRANSCRIPT_CACHE_SIZE", "5000"))
+
+
+def transcript_key(audio, **settings):
+    """sha256 of the audio bytes plus every setting that changes the output (model, profile, prompt...)."""
+    h = hashlib.sha256(bytes(audio))
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class TranscriptCache:
+    """
+    Transcripts by transcript_key(), in SQLite, so a clip that Streamlit
+    hands us again on a rerun (or another user uploads) is never decoded
+    twice. Values are segment lists: [{"text"}] or [{"start", "end", "text"}].
+    Entries older than `ttl` seconds are dropped, and past `max_entries`
+    the least recently used go first.
+    """
+
+    def __init__(self, path=DEFAULT_TRANSCRIPT_DB, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (key TEXT PRIMARY KEY, segments TEXT, created REAL) WITHOUT ROWID"
+        )
+        # databases from before pruning have no last_used column
+        columns = [c[1] for c in self._db.execute("PRAGMA table_info(transcripts)")]
+        if "last_used" not in columns:
+            self._db.execute("ALTER TABLE transcripts ADD COLUMN last_used REAL")
+            self._db.execute("UPDATE transcripts SET last_used = created")
+        self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_lru ON transcripts(last_used)")
+        self._db.commit()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT segments, created FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, segments):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(segments), now, now))
+            self._db.execute("DELETE FROM transcripts WHERE created < ?", (now - self.ttl,))
+            count = self._db.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM transcripts WHERE key IN "
+                    "(SELECT key FROM transcripts ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
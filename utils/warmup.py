@@ -0,0 +1,94 @@
+import contextlib
+import os
+import threading
+import time
+
+import numpy as np
+
+# what the background warm-up preloads, in order; "" or "0" turns it off
+PARTS = [p.strip() for p in os.getenv("INTELEXI_WARMUP", "llm,pdf,embedder,whisper").split(",")
+         if p.strip() not in ("", "0")]
+
+_IMPORTED = time.time()
+
+
+def process_age():
+    """Seconds since this process started (from /proc on Linux, else since this module was imported)."""
+    try:
+        with open("/proc/self/stat") as fh:
+            # field 22, counted after the ")" that closes the command name
+            start_ticks = int(fh.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as fh:
+            boot = next(int(line.split()[1]) for line in fh if line.startswith("btime"))
+        return time.time() - (boot + start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return time.time() - _IMPORTED
+
+
+class StartupReport:
+    """Named startup timings in ms (first paint, model loads, first calls), safe to fill from any thread."""
+
+    def __init__(self):
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name, ms, once=False):
+        with self._lock:
+            if once and name in self._timings:
+                return
+            self._timings[name] = round(ms, 1)
+        print(f"[startup] {name}: {ms:.0f} ms")
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        yield
+        self.mark(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._timings)
+
+
+def _warm_llm(engine):
+    with engine.startup.timed("llm_client_ms"):
+        engine.client
+
+
+def _warm_pdf(engine):
+    with engine.startup.timed("pdf_import_ms"):
+        # the backend ingest uses; PyPDF2 is an optional extra
+        import pdfplumber  # noqa: F401
+
+
+def _warm_embedder(engine):
+    with engine.startup.timed("embedder_load_ms"):
+        engine.embedder()
+    # first calls allocate / pick kernels; the cache check also runs the probe texts
+    with engine.startup.timed("embedder_first_call_ms"):
+        engine.embedding_cache()
+        engine.query_batcher.encode("warm-up question about the uploaded document")
+
+
+def _warm_whisper(engine):
+    from utils.whisper_utils import SAMPLE_RATE, transcribe_segments
+
+    with engine.startup.timed("whisper_load_ms"):
+        model = engine.whisper()
+    with engine.startup.timed("whisper_first_call_ms"):
+        t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+        list(transcribe_segments(model, (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), vad=False))
+
+
+WARMERS = {"llm": _warm_llm, "pdf": _warm_pdf, "embedder": _warm_embedder, "whisper": _warm_whisper}
+
+
+def warm_up(engine, parts=None):
+    """Run the warmers for `parts` one after another; a failing part is reported and skipped."""
+    started = time.perf_counter()
+    for part in PARTS if parts is None else parts:
+        try:
+            WARMERS[part](engine)
+        except Exception as exc:
+            print(f"[startup] warm-up of {part} failed: {type(exc).__name__}: {exc}")
+    engine.startup.mark("warmup_total_ms", (time.perf_counter() - started) * 1000)
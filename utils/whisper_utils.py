@@ -0,0 +1,196 @@
+import io
+import os
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+INITIAL_PROMPT = (
+    "Transcribe exactly as spoken. "
+    "The user will give programming commands such as: "
+    "'write a python code', 'generate java program', "
+    "'build algorithm', 'create a function'. "
+    "Do NOT convert words like 'write' to numbers like '5th'. "
+    "Do NOT auto-correct, guess, or interpret. "
+    "Strictly transcribe as text commands."
+)
+
+# beam / latency trade-off; "fast" is greedy decoding for short questions (lower
+# latency, a little less accurate); "accurate" is the original beam search of 5
+PROFILES = {
+    "fast": dict(beam_size=1, best_of=1, without_timestamps=True, condition_on_previous_text=False),
+    "balanced": dict(beam_size=3, best_of=3),
+    "accurate": dict(beam_size=5),
+}
+DEFAULT_PROFILE = os.getenv("INTELEXI_WHISPER_PROFILE", "accurate")
+if DEFAULT_PROFILE not in PROFILES:
+    print(f"[whisper] unknown INTELEXI_WHISPER_PROFILE={DEFAULT_PROFILE!r}, using 'accurate' "
+          f"(choose from {', '.join(PROFILES)})")
+    DEFAULT_PROFILE = "accurate"
+
+# Silero VAD (bundled with faster-whisper): drop silence before decoding
+VAD_PARAMETERS = dict(min_silence_duration_ms=500, speech_pad_ms=200)
+
+# long recordings are cut at pauses into pieces of this many seconds (Whisper's window is 30 s)
+PIECE_MIN_SECONDS = 15
+PIECE_MAX_SECONDS = 30
+# pieces decoded at once; the model needs as many CTranslate2 workers
+LONG_WORKERS = int(os.getenv("INTELEXI_WHISPER_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+FRAME_MS = 30
+MIN_PAUSE_MS = 300
+
+
+def _decode_wav(data):
+    with wave.open(io.BytesIO(data)) as wav:
+        width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 2:
+        audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        audio = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif width == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise wave.Error(f"unsupported sample width {width}")
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # resampling needs a low-pass filter or high frequencies alias; PyAV's resampler has one
+        raise ValueError(f"{rate} Hz WAV needs resampling")
+    return audio
+
+
+def decode_audio(data):
+    """
+    Decode recorded audio bytes to a 16 kHz mono float32 array, in memory.
+    16 kHz PCM WAV is read with the stdlib; anything else (other rates
+    included) goes through faster-whisper's PyAV decoder, which resamples
+    with a proper anti-alias filter.
+    """
+    try:
+        return _decode_wav(data)
+    except (wave.Error, EOFError, ValueError):
+        pass
+    from faster_whisper import decode_audio as av_decode
+    try:
+        return av_decode(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+    except Exception:
+        # some containers need a seekable real file; never leave it behind
+        fd, path = tempfile.mkstemp(suffix=".audio")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            return av_decode(path, sampling_rate=SAMPLE_RATE)
+        finally:
+            os.remove(path)
+
+
+def transcribe_segments(model, audio, profile=None, initial_prompt=INITIAL_PROMPT, vad=True):
+    """Yield segment texts as Whisper finishes them."""
+    if isinstance(audio, (bytes, bytearray)):
+        audio = decode_audio(bytes(audio))
+    segments, _ = model.transcribe(
+        audio,
+        temperature=0.0,
+        initial_prompt=initial_prompt,
+        vad_filter=vad,
+        vad_parameters=VAD_PARAMETERS if vad else None,
+        **PROFILES[profile or DEFAULT_PROFILE],
+    )
+    for seg in segments:
+        text = seg.text if hasattr(seg, "text") else seg[2]
+        if text.strip():
+            yield text.strip()
+
+
+def transcribe(model, audio, **kwargs):
+    return " ".join(transcribe_segments(model, audio, **kwargs)).strip()
+
+
+def _frame_rms(audio, frame):
+    n = len(audio) // frame
+    frames = audio[:n * frame].reshape(n, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def split_on_silence(audio, min_seconds=PIECE_MIN_SECONDS, max_seconds=PIECE_MAX_SECONDS,
+                     frame_ms=FRAME_MS, min_pause_ms=MIN_PAUSE_MS):
+    """
+    Cut 16 kHz audio into [(start, stop)] sample ranges of at most
+    `max_seconds`, each ending in the middle of the longest pause found
+    between `min_seconds` and `max_seconds` (a hard cut only when the
+    speaker never pauses). Pauses are frames well below the clip's loudness.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    rms = _frame_rms(audio, frame)
+    if len(rms) == 0:
+        return [(0, len(audio))] if len(audio) else []
+    # relative to the clip: twice its noise floor, but below half its typical level
+    threshold = max(min(np.percentile(rms, 10) * 2, np.median(rms) * 0.5), 1e-4)
+    silent = rms < threshold
+    lo, hi = min_seconds * 1000 // frame_ms, max_seconds * 1000 // frame_ms
+    min_run = max(1, min_pause_ms // frame_ms)
+
+    pieces, start = [], 0
+    while len(rms) - start > hi:
+        window = silent[start + lo:start + hi]
+        best, best_len, run = None, 0, 0
+        for i, quiet in enumerate(window):
+            run = run + 1 if quiet else 0
+            if run >= min_run and run > best_len:
+                best, best_len = i - run // 2, run
+        cut = start + (lo + best if best is not None else hi)
+        pieces.append((start * frame, cut * frame))
+        start = cut
+    pieces.append((start * frame, len(audio)))
+    return pieces
+
+
+def transcribe_long(model, audio, profile=None, workers=LONG_WORKERS, initial_prompt=None,
+                    on_piece=None, pieces=None):
+    """
+    Transcribe a long recording: split at pauses, decode the pieces on
+    `workers` threads (CTranslate2 runs them in parallel when the model has
+    that many workers), and merge the segments back in order with
+    timestamps relative to the whole recording.
+    Returns [{"start", "end", "text"}]; on_piece(done, total) reports progress.
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        audio = decode_audio(bytes(audio))
+    pieces = pieces or split_on_silence(audio)
+    # timestamps are the point of this mode, whatever the profile says
+    options = dict(PROFILES[profile or DEFAULT_PROFILE], without_timestamps=False)
+
+    def run(piece):
+        start, stop = piece
+        segments, _ = model.transcribe(
+            audio[start:stop],
+            temperature=0.0,
+            initial_prompt=initial_prompt,
+            vad_filter=True,
+            vad_parameters=VAD_PARAMETERS,
+            **options,
+        )
+        offset = start / SAMPLE_RATE
+        return [{"start": round(offset + float(seg.start), 2), "end": round(offset + float(seg.end), 2),
+                 "text": seg.text.strip()} for seg in segments if seg.text.strip()]
+
+    out = [None] * len(pieces)
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        futures = {pool.submit(run, piece): i for i, piece in enumerate(pieces)}
+        for done, fut in enumerate(as_completed(futures), 1):
+            out[futures[fut]] = fut.result()
+            if on_piece is not None:
+                on_piece(done, len(pieces))
+    return [seg for piece in out for seg in piece]
+
+
+def format_timestamp(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
@@ -0,0 +1,245 @@
+import gzip
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from xml.etree import ElementTree
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "wikipedia.sqlite")
+# found summaries rarely change; misses are retried sooner
+TTL_SECONDS = 7 * 24 * 3600
+NEGATIVE_TTL_SECONDS = 24 * 3600
+# network errors are only remembered briefly, so an outage doesn't stick
+ERROR_TTL_SECONDS = 60
+MAX_ENTRIES = 50000
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how in is it of on or the to was "
+    "what when where which who why with about explain tell me define".split()
+)
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def first_sentences(text, sentences):
+    return " ".join(_SENTENCE.split(text.strip())[:sentences])
+
+
+class SummaryCache:
+    """
+    Persistent TTL + LRU cache of summaries in SQLite. A stored None is a
+    negative result ("no article"), so repeated misses skip the lookup too.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_lru ON summaries(last_used)")
+        self._db.commit()
+
+    def get(self, key):
+        """Return (found, value); value is None for a cached negative result."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return False, None
+            self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return True, row[0]
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (key, value, now + ttl, now)
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
+
+
+class OnlineBackend:
+    """The wikipedia package (network)."""
+
+    def summary(self, query, sentences):
+        import wikipedia
+        try:
+            return wikipedia.summary(query, sentences=sentences), TTL_SECONDS
+        except wikipedia.exceptions.WikipediaException:
+            # no page, ambiguous title, ... : a real negative result
+            return None, NEGATIVE_TTL_SECONDS
+        except Exception:
+            # network / HTTP failure
+            return None, ERROR_TTL_SECONDS
+
+
+class LocalBackend:
+    """
+    Offline lookup over a Wikipedia abstracts dump (see build_local_index).
+    An exact title match wins; otherwise articles are ranked by idf-weighted
+    overlap between the query terms and their title + abstract terms.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.n_docs = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query, limit=1):
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM docs WHERE norm_title = ?", (" ".join(_WORD.findall(query.lower())),)
+            ).fetchone()
+            if row is not None:
+                return [row[0]]
+            ids, weights = [], []
+            for term in terms:
+                hit = self._db.execute("SELECT ids FROM postings WHERE term = ?", (term,)).fetchone()
+                if hit is None:
+                    continue
+                term_ids = np.frombuffer(hit[0], dtype=np.int32)
+                ids.append(term_ids)
+                weights.append(np.full(len(term_ids), math.log(1 + self.n_docs / len(term_ids))))
+        if not ids:
+            return []
+        docs, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        order = np.lexsort((docs, -scores))[:limit]
+        return [int(d) for d in docs[order]]
+
+    def summary(self, query, sentences):
+        ids = self.search(query)
+        if not ids:
+            return None, NEGATIVE_TTL_SECONDS
+        with self._lock:
+            abstract = self._db.execute("SELECT abstract FROM docs WHERE id = ?", (ids[0],)).fetchone()[0]
+        return first_sentences(abstract, sentences), TTL_SECONDS
+
+
+def build_local_index(dump_path, index_path, max_df=0.05):
+    """
+    Build the offline index from an enwiki-*-abstract.xml(.gz) dump.
+    Terms in more than `max_df` of all articles are left out of the postings.
+    """
+    opener = gzip.open if dump_path.endswith(".gz") else open
+    postings = {}
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    db = sqlite3.connect(index_path)
+    db.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, title TEXT, norm_title TEXT, abstract TEXT)")
+    rows = []
+    doc_id = 0
+    with opener(dump_path, "rb") as fh:
+        for _, elem in ElementTree.iterparse(fh):
+            if elem.tag != "doc":
+                continue
+            title = (elem.findtext("title") or "").removeprefix("Wikipedia: ").strip()
+            abstract = (elem.findtext("abstract") or "").strip()
+            elem.clear()
+            if not title or len(abstract) < 20:
+                continue
+            rows.append((doc_id, title, " ".join(_WORD.findall(title.lower())), abstract))
+            for term in set(tokenize(title + " " + abstract)):
+                postings.setdefault(term, array("i")).append(doc_id)
+            doc_id += 1
+            if len(rows) >= 10000:
+                db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+                rows = []
+    db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+    db.execute("CREATE INDEX docs_title ON docs(norm_title)")
+    db.execute("CREATE TABLE postings (term TEXT PRIMARY KEY, ids BLOB)")
+    limit = max(1, int(max_df * doc_id))
+    db.executemany(
+        "INSERT INTO postings VALUES (?, ?)",
+        ((t, ids.tobytes()) for t, ids in postings.items() if len(ids) <= limit),
+    )
+    db.commit()
+    db.close()
+    return doc_id
+
+
+class WikiFallback:
+    """Cache first, then the local index (if any), then the network (unless offline)."""
+
+    def __init__(self, cache=None, local=None, online=True):
+        self.cache = cache
+        self.local = local
+        self.online = OnlineBackend() if online else None
+
+    def summary(self, query, sentences=4):
+        key = f"{sentences}:{' '.join(query.lower().split())}"
+        if self.cache is not None:
+            found, value = self.cache.get(key)
+            if found:
+                return value
+        value, ttl = None, NEGATIVE_TTL_SECONDS
+        for backend in (self.local, self.online):
+            if backend is not None:
+                value, ttl = backend.summary(query, sentences)
+                if value:
+                    break
+        if self.cache is not None:
+            self.cache.put(key, value, ttl)
+        return value
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_fallback():
+    """
+    Process-wide fallback configured from the environment:
+    INTELEXI_WIKI_CACHE (cache path), INTELEXI_WIKI_INDEX (offline index),
+    INTELEXI_WIKI_OFFLINE=1 (never touch the network).
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            index_path = os.getenv("INTELEXI_WIKI_INDEX")
+            _default = WikiFallback(
+                cache=SummaryCache(os.getenv("INTELEXI_WIKI_CACHE", DEFAULT_CACHE_PATH)),
+                local=LocalBackend(index_path) if index_path else None,
+                online=os.getenv("INTELEXI_WIKI_OFFLINE", "") != "1",
+            )
+        return _default
+
+
+def wiki_search(query, sentences=4):
+    return default_fallback().summary(query, sentences=sentences)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m utils.wikipedia_utils <abstract-dump.xml[.gz]> <index.sqlite>")
+    print(f"indexed {build_local_index(sys.argv[1], sys.argv[2])} articles")